@@ -0,0 +1,91 @@
+"""
+Micro-lotes de embeddings para las búsquedas concurrentes del servicio.
+"""
+import asyncio
+import os
+from typing import List, Dict, Callable, Awaitable, Optional, Set, Tuple
+
+VENTANA_EMBEDDINGS = float(os.environ.get("VENTANA_EMBEDDINGS_MS", 5)) / 1000  # segundos
+MAX_LOTE_EMBEDDINGS = int(os.environ.get("MAX_LOTE_EMBEDDINGS", 64))  # textos por llamada a embeddings.create
+
+
+class AgrupadorEmbeddings:
+    """
+    Junta los textos que llegan dentro de una ventana corta (o hasta completar
+    `max_lote`) y los manda en una sola llamada a `embeber_lote`; cada búsqueda
+    recibe su vector. Si no hay ninguna llamada en curso el texto sale sin
+    esperar la ventana, así una búsqueda aislada no paga latencia extra: los
+    lotes se forman con lo que llega mientras otra llamada está en vuelo.
+    """
+
+    def __init__(self, embeber_lote: Callable[[List[str]], Awaitable[List[List[float]]]],
+                 ventana: float = VENTANA_EMBEDDINGS, max_lote: int = MAX_LOTE_EMBEDDINGS):
+        self.embeber_lote = embeber_lote
+        self.ventana = ventana
+        self.max_lote = max_lote
+        self.llamadas = 0
+        self.textos = 0
+        self._pendientes: List[Tuple[str, asyncio.Future]] = []
+        self._temporizador: Optional[asyncio.TimerHandle] = None
+        self._en_vuelo = 0
+        self._tareas: Set[asyncio.Task] = set()  # el loop solo guarda referencias débiles a las tareas
+
+    async def embeber(self, texto: str) -> List[float]:
+        futuro = asyncio.get_running_loop().create_future()
+        self._pendientes.append((texto, futuro))
+        if self._en_vuelo == 0 or len(self._pendientes) >= self.max_lote:
+            self._despachar()
+        elif self._temporizador is None:
+            self._temporizador = asyncio.get_running_loop().call_later(self.ventana, self._despachar)
+        return await futuro
+
+    def _despachar(self):
+        if self._temporizador is not None:
+            self._temporizador.cancel()
+            self._temporizador = None
+        while self._pendientes:
+            lote, self._pendientes = self._pendientes[:self.max_lote], self._pendientes[self.max_lote:]
+            self._en_vuelo += 1
+            tarea = asyncio.ensure_future(self._enviar(lote))
+            self._tareas.add(tarea)
+            tarea.add_done_callback(self._tareas.discard)
+
+    async def _enviar(self, lote: List[Tuple[str, asyncio.Future]]):
+        # Textos repetidos dentro del lote se embeben una vez
+        posiciones: Dict[str, int] = {}
+        for texto, _ in lote:
+            posiciones.setdefault(texto, len(posiciones))
+        self.llamadas += 1
+        self.textos += len(posiciones)
+        try:
+            vectores = await self.embeber_lote(list(posiciones))
+        except asyncio.CancelledError:
+            for _, futuro in lote:
+                futuro.cancel()
+            raise
+        except Exception as e:
+            for _, futuro in lote:
+                if not futuro.done():
+                    futuro.set_exception(e)
+            return
+        finally:
+            self._en_vuelo -= 1
+        for texto, futuro in lote:
+            if not futuro.done():  # la búsqueda pudo cancelarse por timeout
+                futuro.set_result(vectores[posiciones[texto]])
+
+    async def cerrar(self):
+        """Cancela los lotes en curso y los pendientes; las búsquedas que esperaban reciben CancelledError."""
+        if self._temporizador is not None:
+            self._temporizador.cancel()
+            self._temporizador = None
+        for _, futuro in self._pendientes:
+            futuro.cancel()
+        self._pendientes = []
+        tareas = list(self._tareas)
+        for tarea in tareas:
+            tarea.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+
+    def estadisticas(self) -> Dict[str, int]:
+        return {"llamadas": self.llamadas, "textos": self.textos, "en_vuelo": self._en_vuelo}
@@ -0,0 +1,126 @@
+"""
+Extracción de los platos de la foto de un menú.
+
+Un extractor es cualquier objeto con `extraer_items(imagen, tipo)`, un
+generador asíncrono que entrega los platos a medida que los encuentra:
+ExtractorOpenAI usa un modelo de visión y ExtractorFijo devuelve una lista
+dada, para pruebas de carga sin llamar a la API.
+"""
+import asyncio
+import base64
+import json
+import os
+import re
+import sys
+from typing import List, AsyncIterator, Iterable
+
+from openai import AsyncOpenAI
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pinecone"))
+from motor_enriquecimiento import ParserArrayJSON
+
+MODELO_VISION = os.environ.get("MODELO_VISION", "gpt-4o-mini")
+MAX_TOKENS_EXTRACCION = 2000
+TIMEOUT_EXTRACCION = 60.0  # segundos
+# Si está definido, los platos salen de este archivo (uno por línea) en lugar del modelo de visión
+EXTRACTOR_MENU_ARCHIVO = os.environ.get("EXTRACTOR_MENU_ARCHIVO")
+
+PROMPT_EXTRACCION = """
+Esta imagen es la foto de un menú o carta de un restaurante.
+Listá cada plato, bebida o postre que aparece, uno por elemento, con el texto tal como figura en el menú
+(sin precios, sin descripciones largas y sin títulos de sección como "Entradas" o "Postres").
+
+Respondé únicamente con un objeto JSON de la forma: {"items": ["plato 1", "plato 2", ...]}
+"""
+
+def items_de_respuesta(contenido: str) -> List[str]:
+    """Lee {"items": [...]} de la respuesta del modelo, tolerando bloques ```json."""
+    contenido = re.sub(r"^```(?:json)?|```$", "", contenido.strip()).strip()
+    try:
+        datos = json.loads(contenido)
+    except json.JSONDecodeError:
+        # Sin JSON válido: una línea por plato
+        return [linea.strip(" -*•\t") for linea in contenido.splitlines() if linea.strip(" -*•\t")]
+    items = datos.get("items", []) if isinstance(datos, dict) else datos
+    return [str(item) for item in items] if isinstance(items, list) else []
+
+
+class FiltroRepetidos:
+    """Descarta platos vacíos o repetidos (sin distinguir mayúsculas) a medida que llegan."""
+
+    def __init__(self):
+        self._vistos = set()
+
+    def nuevo(self, item) -> str:
+        """El plato limpio, o '' si está vacío o ya apareció."""
+        item = str(item).strip()
+        if not item or item.lower() in self._vistos:
+            return ""
+        self._vistos.add(item.lower())
+        return item
+
+
+class ExtractorOpenAI:
+    """Pide al modelo de visión la lista de platos de la imagen."""
+
+    def __init__(self, openai_client: AsyncOpenAI, modelo: str = MODELO_VISION):
+        self.openai = openai_client
+        self.modelo = modelo
+
+    async def extraer_items(self, imagen: bytes, tipo: str = "image/jpeg") -> AsyncIterator[str]:
+        """Los platos salen de la respuesta en streaming apenas se cierra cada string del array."""
+        url = f"data:{tipo};base64,{base64.b64encode(imagen).decode('ascii')}"
+        stream = await self.openai.chat.completions.create(
+            model=self.modelo,
+            messages=[{"role": "user", "content": [
+                {"type": "text", "text": PROMPT_EXTRACCION},
+                {"type": "image_url", "image_url": {"url": url, "detail": "high"}},
+            ]}],
+            max_tokens=MAX_TOKENS_EXTRACCION,
+            temperature=0,
+            response_format={"type": "json_object"},
+            timeout=TIMEOUT_EXTRACCION,
+            stream=True,
+        )
+        parser = ParserArrayJSON()
+        filtro = FiltroRepetidos()
+        contenido = []
+        entregados = 0
+        async for chunk in stream:
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            fragmento = chunk.choices[0].delta.content
+            contenido.append(fragmento)
+            for elemento in parser.alimentar(fragmento):
+                item = filtro.nuevo(elemento)
+                if item:
+                    entregados += 1
+                    yield item
+        if entregados == 0:
+            # Respuesta sin el array esperado: se interpreta completa
+            for elemento in items_de_respuesta("".join(contenido)):
+                item = filtro.nuevo(elemento)
+                if item:
+                    yield item
+
+
+class ExtractorFijo:
+    """Entrega siempre los mismos platos, con una demora opcional entre uno y otro."""
+
+    def __init__(self, items: Iterable[str], demora: float = 0.0):
+        self.items = list(items)
+        self.demora = demora
+
+    @classmethod
+    def desde_archivo(cls, ruta: str, demora: float = 0.0) -> "ExtractorFijo":
+        with open(ruta, "r", encoding="utf-8") as f:
+            return cls([linea for linea in f.read().splitlines() if linea.strip()], demora)
+
+    async def extraer_items(self, imagen: bytes, tipo: str = "image/jpeg") -> AsyncIterator[str]:
+        filtro = FiltroRepetidos()
+        for elemento in self.items:
+            if self.demora:
+                await asyncio.sleep(self.demora)
+            item = filtro.nuevo(elemento)
+            if item:
+                yield item
@@ -0,0 +1,75 @@
+"""
+Normalización de las fotos de menú antes de la extracción.
+
+Los teléfonos suben fotos de 4 a 12 MB; el modelo de visión igual las reduce
+antes de leerlas. Acá se orientan según EXIF, se pasan a escala de grises con
+contraste estirado, se achican a la resolución que usa el modelo y se
+recomprimen en JPEG. El trabajo es CPU puro, así que corre en un pool de
+procesos y no bloquea el loop del servicio.
+"""
+import asyncio
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+from PIL import Image, ImageOps
+
+# Con detail "high" OpenAI ajusta la imagen a 2048x2048 y después lleva el lado menor a 768
+LADO_MAXIMO = 2048
+LADO_MENOR_MAXIMO = 768
+CALIDAD_JPEG = 85
+ESCALA_GRISES = os.environ.get("NORMALIZAR_ESCALA_GRISES", "1") == "1"
+PROCESOS_NORMALIZACION = int(os.environ.get("PROCESOS_NORMALIZACION", min(4, os.cpu_count() or 1)))
+
+def normalizar_imagen(imagen: bytes, lado_maximo: int = LADO_MAXIMO, lado_menor_maximo: int = LADO_MENOR_MAXIMO,
+                      escala_grises: bool = ESCALA_GRISES, calidad: int = CALIDAD_JPEG) -> bytes:
+    """Devuelve la imagen orientada, normalizada, achicada y en JPEG."""
+    with Image.open(io.BytesIO(imagen)) as original:
+        foto = ImageOps.exif_transpose(original)
+        if escala_grises:
+            foto = ImageOps.autocontrast(foto.convert("L"), cutoff=1)
+        else:
+            foto = ImageOps.autocontrast(foto.convert("RGB"), cutoff=1)
+
+        ancho, alto = foto.size
+        escala = min(1.0, lado_maximo / max(ancho, alto), lado_menor_maximo / min(ancho, alto))
+        if escala < 1.0:
+            foto = foto.resize((max(1, round(ancho * escala)), max(1, round(alto * escala))), Image.LANCZOS)
+
+        salida = io.BytesIO()
+        foto.save(salida, format="JPEG", quality=calidad, optimize=True)
+        return salida.getvalue()
+
+
+class NormalizadorImagenes:
+    """Etapa de preprocesamiento del pipeline del menú: normaliza en un pool de procesos."""
+
+    def __init__(self, procesos: int = PROCESOS_NORMALIZACION):
+        self.procesos = procesos
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _obtener_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: el servicio ya tiene hilos propios (refresco del cache) y no conviene hacer fork
+            self._pool = ProcessPoolExecutor(max_workers=self.procesos,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def __call__(self, imagen: bytes, tipo: str) -> Tuple[bytes, str]:
+        try:
+            normalizada = await asyncio.get_running_loop().run_in_executor(
+                self._obtener_pool(), normalizar_imagen, imagen
+            )
+        except Exception as e:
+            # Formato que Pillow no abre: se manda tal cual y que decida el extractor
+            print(f"⚠️ No se pudo normalizar la imagen ({tipo}): {e}")
+            return imagen, tipo
+        print(f"🖼️ Imagen normalizada: {len(imagen) // 1024} KB -> {len(normalizada) // 1024} KB")
+        return normalizada, "image/jpeg"
+
+    def cerrar(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,101 @@
+"""
+Procesamiento de la foto de un menú en etapas superpuestas:
+
+    normalizar imagen -> extraer platos -> buscar pictogramas -> respuesta
+
+Cada etapa corre en su propia tarea y se comunica con la siguiente por una
+cola acotada: la búsqueda de los primeros platos empieza mientras el
+extractor todavía está leyendo el resto del menú, y si el cliente consume
+lento (streaming) las colas llenas frenan a las etapas anteriores.
+"""
+import asyncio
+import os
+from typing import List, Dict, Any, Callable, Awaitable, AsyncIterator, Optional, Tuple
+
+TRABAJADORES_BUSQUEDA_MENU = int(os.environ.get("TRABAJADORES_BUSQUEDA_MENU", 16))  # búsquedas simultáneas por menú
+MAX_COLA_MENU = 32  # platos en espera entre una etapa y la siguiente
+
+_FIN = object()
+
+async def sin_preprocesar(imagen: bytes, tipo: str) -> Tuple[bytes, str]:
+    return imagen, tipo
+
+
+class PipelineMenu:
+    """
+    `preprocesar(imagen, tipo)` devuelve la imagen normalizada, el extractor
+    entrega los platos con `extraer_items` y `buscar(plato, top_k)` es la
+    búsqueda del servicio. `procesar` entrega el mejor pictograma de cada
+    plato apenas se resuelve, con la `posicion` del plato en el menú.
+    """
+
+    def __init__(self, extractor, buscar: Callable[[str, int], Awaitable[List[Dict[str, Any]]]],
+                 preprocesar: Callable[[bytes, str], Awaitable[Tuple[bytes, str]]] = sin_preprocesar,
+                 trabajadores: int = TRABAJADORES_BUSQUEDA_MENU, max_cola: int = MAX_COLA_MENU):
+        self.extractor = extractor
+        self.buscar = buscar
+        self.preprocesar = preprocesar
+        self.trabajadores = trabajadores
+        self.max_cola = max_cola
+
+    async def _extraer(self, imagen: bytes, tipo: str, items: asyncio.Queue, errores: List[BaseException]):
+        try:
+            imagen, tipo = await self.preprocesar(imagen, tipo)
+            posicion = 0
+            platos = self.extractor.extraer_items(imagen, tipo)
+            try:
+                async for item in platos:
+                    await items.put((posicion, item))
+                    posicion += 1
+            finally:
+                # Al cancelar, cierra ya el generador (y el stream de OpenAI que tenga abierto)
+                await platos.aclose()
+            print(f"🧾 {posicion} platos extraídos de la imagen")
+        except Exception as e:
+            errores.append(e)
+        # Sin finally: si la tarea se cancela, los buscadores también se cancelaron
+        # y un put sobre la cola llena no volvería nunca
+        for _ in range(self.trabajadores):
+            await items.put(_FIN)
+
+    async def _buscar(self, items: asyncio.Queue, resultados: asyncio.Queue):
+        while True:
+            siguiente = await items.get()
+            if siguiente is _FIN:
+                await resultados.put(_FIN)
+                return
+            posicion, item = siguiente
+            try:
+                encontrados = await self.buscar(item, 1)
+            except Exception as e:
+                print(f"⚠️ Falló la búsqueda de '{item}': {e}")
+                encontrados = []
+            await resultados.put((posicion, item, encontrados))
+
+    async def procesar(self, imagen: bytes, tipo: str) -> AsyncIterator[Tuple[int, str, Optional[Dict[str, Any]]]]:
+        """
+        Entrega (posicion, plato, mejor resultado o None) en orden de llegada.
+        Si la extracción falla, lo ya resuelto se entrega igual y el error se
+        levanta al final.
+        """
+        items: asyncio.Queue = asyncio.Queue(self.max_cola)
+        resultados: asyncio.Queue = asyncio.Queue(self.max_cola)
+        errores: List[BaseException] = []
+        tareas = [asyncio.ensure_future(self._extraer(imagen, tipo, items, errores))]
+        tareas += [asyncio.ensure_future(self._buscar(items, resultados)) for _ in range(self.trabajadores)]
+        try:
+            terminados = 0
+            while terminados < self.trabajadores:
+                siguiente = await resultados.get()
+                if siguiente is _FIN:
+                    terminados += 1
+                    continue
+                posicion, item, encontrados = siguiente
+                yield posicion, item, encontrados[0] if encontrados else None
+            if errores:
+                raise errores[0]
+        finally:
+            # El cliente de un stream pudo desconectarse a mitad del menú
+            for tarea in tareas:
+                tarea.cancel()
+            await asyncio.gather(*tareas, return_exceptions=True)
@@ -0,0 +1,479 @@
+"""
+Servicio HTTP asíncrono de búsqueda de pictogramas (reemplaza a hello.py).
+
+Un solo proceso atiende cientos de búsquedas concurrentes: los clientes de
+OpenAI y Pinecone son asíncronos, mantienen conexiones keep-alive en un pool
+y se crean recién con la primera búsqueda. Para varios procesos:
+
+    gunicorn servicio:crear_app --worker-class aiohttp.GunicornWebWorker --workers 4
+
+También implementa los webhooks que llama el front (rufus_app), con los mismos
+contratos que el flujo de n8n, así que alcanza con apuntar el front acá:
+
+    POST /webhook/buscar_pictograma  {"elemento_principal": "..."} -> [{id, nombre}]
+    POST /webhook/send_image         multipart "imagen"            -> [{id, nombre, item_original}]
+
+Con ?stream=ndjson (o ?stream=sse) send_image devuelve cada plato apenas se
+resuelve, en lugar de esperar al menú completo.
+"""
+import asyncio
+import copy
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from typing import List, Dict, Any, Optional
+
+import httpx
+from aiohttp import web
+from openai import AsyncOpenAI
+from pinecone import PineconeAsyncio
+from dotenv import load_dotenv
+
+# La lógica de búsqueda vive en pinecone/
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pinecone"))
+from insert_pinecone3 import (NAMESPACE, INDEX_NAME, DIMENSION, BUSQUEDA_HIBRIDA, CANDIDATOS_FUSION,
+                              texto_consulta, resultados_de_matches, sin_coincidencia_confiable, namespace_cache,
+                              coincidencias_lexicas)
+from embeddings import MODELO_EMBEDDING
+from registro_indices import NAMESPACE_VERSIONES, TTL_STATS, version_de_fetch
+from indice_local import IndiceLocal
+from indice_lexico import obtener_indice_lexico
+from correccion import obtener_corrector
+from cache_busquedas import CacheBusquedas, normalizar_consulta
+from extraccion_menu import ExtractorOpenAI, ExtractorFijo, EXTRACTOR_MENU_ARCHIVO
+from pipeline_menu import PipelineMenu
+from normalizacion_imagen import NormalizadorImagenes
+from agrupador_embeddings import AgrupadorEmbeddings
+
+load_dotenv()
+
+PINECONE_API_KEY = os.environ.get("PINECONE_API_KEY")
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+# Si está definido, las búsquedas van contra un bundle local (exportar_namespace.py) en lugar de Pinecone
+INDICE_LOCAL_BUNDLE = os.environ.get("INDICE_LOCAL_BUNDLE")
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", 5000))
+
+MAX_CONCURRENCIA = int(os.environ.get("MAX_CONCURRENCIA", 256))  # búsquedas semánticas simultáneas
+MAX_CONEXIONES = 100  # conexiones HTTP abiertas hacia OpenAI
+MAX_CONEXIONES_KEEPALIVE = 20
+TIMEOUT_EMBEDDING = 10.0  # segundos
+TIMEOUT_BUSQUEDA = 5.0
+HILOS_CACHE = 4  # hilos para las lecturas y escrituras SQLite del cache de búsquedas
+MAX_TOP_K = 20  # tope de resultados que puede pedir un cliente en /buscar
+TOP_K_WEBHOOK = int(os.environ.get("TOP_K_WEBHOOK", 5))  # opciones que recibe el front por búsqueda
+MAX_BYTES_IMAGEN = int(os.environ.get("MAX_BYTES_IMAGEN", 15 * 1024 * 1024))
+CORS_ORIGEN = os.environ.get("CORS_ORIGEN", "*")
+FORMATOS_STREAM = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+def construir_texto_enriquecido(p: Dict[str, Any]) -> str:
+    nombres = p.get("nombre", [])
+    if not isinstance(nombres, list):
+        nombres = [nombres]
+    nombres_str = ", ".join(nombres)
+
+    definicion = p.get("definicion", "")
+    ingredientes = ", ".join(p.get("ingredientes", [])) if p.get("ingredientes") else ""
+    forma_servir = p.get("forma_de_servir", "")
+    origen = p.get("origen", "")
+    coccion = p.get("tipo_de_coccion", "")
+    categoria = p.get("categoria", "")
+    subcategoria = p.get("subcategoria", "")
+    equivalentes = ", ".join(p.get("equivalentes", [])) if p.get("equivalentes") else ""
+
+    return (
+        f"Nombre del pictograma: {nombres_str}\n"
+        f"Definición: {definicion}\n"
+        f"Ingredientes: {ingredientes}\n"
+        f"Forma de servir: {forma_servir}\n"
+        f"Origen: {origen}\n"
+        f"Tipo de cocción: {coccion}\n"
+        f"Categoría: {categoria}\n"
+        f"Subcategoría: {subcategoria}\n"
+        f"Equivalentes: {equivalentes}"
+    )
+
+
+class BackendPinecone:
+    """Namespace de Pinecone consultado con el cliente asíncrono (pool de conexiones aiohttp)."""
+
+    def __init__(self, api_key: str, nombre_indice: str = INDEX_NAME):
+        self.api_key = api_key
+        self.nombre_indice = nombre_indice
+        self._pc = None
+        self._index = None
+        self._version = None
+        self._version_consultada = 0.0
+        self._vuelo_version = VueloUnico()  # al vencer el TTL, una sola consulta para todas las búsquedas
+
+    async def iniciar(self):
+        self._pc = PineconeAsyncio(api_key=self.api_key)
+        descripcion = await self._pc.describe_index(self.nombre_indice)
+        self._index = self._pc.IndexAsyncio(host=descripcion.host)
+
+    async def query(self, vector: List[float], top_k: int):
+        return await self._index.query(vector=vector, top_k=top_k, namespace=NAMESPACE, include_metadata=True)
+
+    async def _consultar_version(self) -> str:
+        # La publica cada escritura al namespace (registro_indices.publicar_version)
+        respuesta = await asyncio.wait_for(
+            self._index.fetch(ids=[NAMESPACE], namespace=NAMESPACE_VERSIONES), TIMEOUT_BUSQUEDA
+        )
+        version = version_de_fetch(respuesta, NAMESPACE)
+        if version is None:
+            # Namespace cargado antes de que existieran las versiones publicadas
+            stats = await asyncio.wait_for(self._index.describe_index_stats(), TIMEOUT_BUSQUEDA)
+            namespaces = stats.get("namespaces", {})
+            cantidad = namespaces[NAMESPACE]["vector_count"] if NAMESPACE in namespaces else 0
+            version = f"n{cantidad}"
+        self._version = version
+        self._version_consultada = time.time()
+        return version
+
+    async def version(self) -> str:
+        if self._version is not None and time.time() - self._version_consultada <= TTL_STATS:
+            return self._version
+        try:
+            return await self._vuelo_version.ejecutar(("version",), self._consultar_version)
+        except Exception as e:
+            if self._version is None:
+                raise
+            # Mejor una versión de hace un rato que cortar la búsqueda
+            print(f"⚠️ No se pudo consultar la versión del namespace: {e}")
+            return self._version
+
+    async def cerrar(self):
+        if self._index is not None:
+            await self._index.close()
+        if self._pc is not None:
+            await self._pc.close()
+
+
+class BackendLocal:
+    """Bundle exportado montado con np.memmap; las consultas no salen del proceso."""
+
+    def __init__(self, ruta_bundle: str):
+        self.indice = IndiceLocal(DIMENSION)
+        self.ruta_bundle = ruta_bundle
+
+    async def iniciar(self):
+        manifiesto = self.indice.cargar_bundle(self.ruta_bundle, NAMESPACE)
+        print(f"📂 Bundle {self.ruta_bundle} montado: {manifiesto['cantidad']} vectores")
+
+    async def query(self, vector: List[float], top_k: int):
+        return self.indice.query(vector=vector, top_k=top_k, namespace=NAMESPACE, include_metadata=True)
+
+    async def version(self) -> str:
+        return self.indice.version(NAMESPACE)
+
+    async def cerrar(self):
+        pass
+
+
+def _avisar_error_cache(futuro: asyncio.Future):
+    if not futuro.cancelled() and futuro.exception() is not None:
+        print(f"⚠️ No se pudo guardar la búsqueda en el cache: {futuro.exception()}")
+
+
+class VueloUnico:
+    """
+    Búsquedas idénticas que llegan mientras una está en curso esperan esa misma
+    tarea en lugar de repetir embedding y consulta (doble toque en el buscador,
+    varias tablets buscando "agua" a la vez). Cada una recibe su propia copia.
+    """
+
+    def __init__(self):
+        self.coalescidas = 0
+        self._en_curso: Dict[tuple, asyncio.Future] = {}
+
+    async def ejecutar(self, clave: tuple, calcular) -> List[Dict[str, Any]]:
+        tarea = self._en_curso.get(clave)
+        if tarea is None:
+            # Tarea aparte: si se cancela la primera solicitud, las demás siguen esperando el resultado
+            tarea = asyncio.ensure_future(calcular())
+            self._en_curso[clave] = tarea
+            tarea.add_done_callback(lambda _: self._en_curso.pop(clave, None))
+        else:
+            self.coalescidas += 1
+        return copy.deepcopy(await asyncio.shield(tarea))
+
+    def estadisticas(self) -> Dict[str, int]:
+        return {"coalescidas": self.coalescidas, "en_curso": len(self._en_curso)}
+
+
+class ServicioBusqueda:
+    """Misma secuencia que buscar_pictograma (corrección, léxico, cache, embedding + índice), sin bloquear el loop."""
+
+    def __init__(self, backend, openai_client: AsyncOpenAI, max_concurrencia: int = MAX_CONCURRENCIA,
+                 extractor=None):
+        self.backend = backend
+        self.openai = openai_client
+        if extractor is None:
+            extractor = (ExtractorFijo.desde_archivo(EXTRACTOR_MENU_ARCHIVO) if EXTRACTOR_MENU_ARCHIVO
+                         else ExtractorOpenAI(openai_client))
+        self.normalizador = NormalizadorImagenes()
+        self.pipeline_menu = PipelineMenu(extractor, self.buscar, preprocesar=self.normalizador)
+        self.agrupador = AgrupadorEmbeddings(self.embeber)
+        self.vuelo_unico = VueloUnico()
+        self.cache = CacheBusquedas()
+        # Se cargan al crear el servicio y no con la primera búsqueda
+        obtener_corrector()
+        obtener_indice_lexico()
+        self._semaforo = asyncio.Semaphore(max_concurrencia)
+        self._loop = asyncio.get_running_loop()
+        # SQLite (y su commit) fuera del loop: una escritura no frena a las demás búsquedas
+        self._hilos_cache = ThreadPoolExecutor(max_workers=HILOS_CACHE, thread_name_prefix="cache-servicio")
+
+    async def embeber(self, textos: List[str]) -> List[List[float]]:
+        respuesta = await self.openai.embeddings.create(input=textos, model=MODELO_EMBEDDING)
+        embeddings = [None] * len(textos)
+        for dato in respuesta.data:
+            embeddings[dato.index] = dato.embedding
+        return embeddings
+
+    async def _buscar_semantico(self, consulta: str, top_k: int) -> List[Dict[str, Any]]:
+        candidatos = max(top_k, CANDIDATOS_FUSION) if BUSQUEDA_HIBRIDA else top_k
+        async with self._semaforo:
+            embedding = await self.agrupador.embeber(texto_consulta(consulta))
+            respuesta = await asyncio.wait_for(self.backend.query(embedding, candidatos), TIMEOUT_BUSQUEDA)
+        return resultados_de_matches(consulta, respuesta["matches"], top_k, candidatos, BUSQUEDA_HIBRIDA)
+
+    def _refrescar(self, consulta: str, top_k: int) -> List[Dict[str, Any]]:
+        # El cache refresca las entradas obsoletas desde su propio hilo
+        futuro = asyncio.run_coroutine_threadsafe(self._buscar_semantico(consulta, top_k), self._loop)
+        return futuro.result(TIMEOUT_EMBEDDING + TIMEOUT_BUSQUEDA)
+
+    async def buscar(self, consulta: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        coincidencias = coincidencias_lexicas(consulta, top_k)
+        if coincidencias:
+            return coincidencias
+        return await self.vuelo_unico.ejecutar((normalizar_consulta(consulta), top_k),
+                                               lambda: self._buscar_cacheado(consulta, top_k))
+
+    async def _buscar_cacheado(self, consulta: str, top_k: int) -> List[Dict[str, Any]]:
+        version = await self.backend.version()
+        cacheado = await self._loop.run_in_executor(
+            self._hilos_cache,
+            lambda: self.cache.consultar(consulta, namespace_cache(), top_k, version,
+                                         lambda: self._refrescar(consulta, top_k),
+                                         es_negativo=sin_coincidencia_confiable)
+        )
+        if cacheado is not None:
+            return cacheado
+
+        resultados = await self._buscar_semantico(consulta, top_k)
+        # Se guarda en segundo plano: la respuesta no espera el commit
+        guardado = self._loop.run_in_executor(
+            self._hilos_cache, self.cache.guardar,
+            self.cache.clave(consulta, namespace_cache(), top_k, version),
+            resultados, sin_coincidencia_confiable(resultados)
+        )
+        guardado.add_done_callback(_avisar_error_cache)
+        return resultados
+
+    async def resolver_menu(self, imagen: bytes, tipo: str):
+        """
+        Va entregando el mejor pictograma de cada plato de la foto a medida que
+        su búsqueda termina (no en el orden del menú: cada pictograma lleva su
+        `posicion`). Los platos sin pictograma se omiten.
+        """
+        async with aclosing(self.pipeline_menu.procesar(imagen, tipo)) as etapas:
+            async for posicion, item, mejor in etapas:
+                if mejor is None:
+                    print(f"⚠️ Sin pictograma para '{item}'")
+                    continue
+                yield {**pictograma_webhook(mejor), "item_original": item, "posicion": posicion}
+
+    async def pictogramas_de_menu(self, imagen: bytes, tipo: str) -> List[Dict[str, Any]]:
+        """El mejor pictograma de cada plato de la foto, en el orden del menú."""
+        pictogramas = [p async for p in self.resolver_menu(imagen, tipo)]
+        pictogramas.sort(key=lambda p: p.pop("posicion"))
+        return pictogramas
+
+    async def cerrar(self):
+        await self.agrupador.cerrar()
+        self.normalizador.cerrar()
+        self._hilos_cache.shutdown(wait=True)
+        await self.backend.cerrar()
+        await self.openai.close()
+
+
+async def crear_servicio() -> ServicioBusqueda:
+    http = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=MAX_CONEXIONES, max_keepalive_connections=MAX_CONEXIONES_KEEPALIVE),
+        timeout=httpx.Timeout(TIMEOUT_EMBEDDING, connect=3.0)
+    )
+    openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http, max_retries=2)
+    backend = BackendLocal(INDICE_LOCAL_BUNDLE) if INDICE_LOCAL_BUNDLE else BackendPinecone(PINECONE_API_KEY)
+    await backend.iniciar()
+    return ServicioBusqueda(backend, openai_client)
+
+async def obtener_servicio(app: web.Application) -> ServicioBusqueda:
+    """Los clientes se crean con la primera búsqueda: /enriquecer no los necesita."""
+    if app["servicio"] is None:
+        async with app["lock_servicio"]:
+            if app["servicio"] is None:
+                app["servicio"] = await crear_servicio()
+    return app["servicio"]
+
+async def enriquecer(request: web.Request) -> web.Response:
+    try:
+        data = await request.json()
+        texto = construir_texto_enriquecido(data)
+        return web.json_response({"texto_enriquecido": texto})
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+async def buscar(request: web.Request) -> web.Response:
+    try:
+        data = await request.json()
+    except Exception:
+        return web.json_response({"error": "El cuerpo debe ser JSON"}, status=400)
+    consulta = str(data.get("consulta", "")).strip()
+    if not consulta:
+        return web.json_response({"error": "Falta 'consulta'"}, status=400)
+    top_k = data.get("top_k", 5)
+    if isinstance(top_k, bool) or not isinstance(top_k, (int, str)) or not str(top_k).strip().isdigit():
+        return web.json_response({"error": "'top_k' debe ser un entero positivo"}, status=400)
+    top_k = min(max(int(top_k), 1), MAX_TOP_K)
+
+    try:
+        servicio = await obtener_servicio(request.app)
+        resultados = await servicio.buscar(consulta, top_k)
+        return web.json_response(resultados)
+    except asyncio.TimeoutError:
+        return web.json_response({"error": "La búsqueda excedió el tiempo límite"}, status=504)
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+def pictograma_webhook(resultado: Dict[str, Any]) -> Dict[str, Any]:
+    """Resultado de búsqueda -> forma que espera el front."""
+    return {"id": resultado["id del pictograma de ARASAAC"], "nombre": resultado.get("nombre del pictograma", "")}
+
+async def webhook_buscar_pictograma(request: web.Request) -> web.Response:
+    try:
+        data = await request.json()
+    except Exception:
+        return web.json_response({"error": "El cuerpo debe ser JSON"}, status=400)
+    consulta = str(data.get("elemento_principal", "")).strip()
+    if not consulta:
+        return web.json_response({"error": "Falta 'elemento_principal'"}, status=400)
+
+    try:
+        servicio = await obtener_servicio(request.app)
+        resultados = await servicio.buscar(consulta, TOP_K_WEBHOOK)
+        return web.json_response([pictograma_webhook(r) for r in resultados])
+    except asyncio.TimeoutError:
+        return web.json_response({"error": "La búsqueda excedió el tiempo límite"}, status=504)
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+def formato_stream(request: web.Request) -> Optional[str]:
+    """
+    'ndjson' o 'sse' si el cliente pidió los resultados en streaming
+    (?stream=ndjson|sse o por Accept), None para la respuesta JSON de siempre.
+    """
+    formato = request.query.get("stream")
+    if formato in FORMATOS_STREAM:
+        return formato
+    aceptados = request.headers.get("Accept", "")
+    for formato, tipo in FORMATOS_STREAM.items():
+        if tipo in aceptados:
+            return formato
+    return None
+
+def evento_stream(formato: str, datos: Dict[str, Any], evento: Optional[str] = None) -> bytes:
+    linea = json.dumps(datos, ensure_ascii=False)
+    if formato == "ndjson":
+        return (linea + "\n").encode("utf-8")
+    return ((f"event: {evento}\n" if evento else "") + f"data: {linea}\n\n").encode("utf-8")
+
+async def responder_stream(request: web.Request, formato: str, imagen: bytes, tipo: str) -> web.StreamResponse:
+    """
+    Un evento por plato apenas se resuelve su búsqueda ({id, nombre,
+    item_original, posicion}), y al final uno de cierre con el total
+    ({"fin": true, "total": n}) o con el error si el proceso falló a mitad.
+    """
+    respuesta = web.StreamResponse(headers={"Content-Type": FORMATOS_STREAM[formato], "Cache-Control": "no-cache"})
+    respuesta.headers["Access-Control-Allow-Origin"] = CORS_ORIGEN
+    await respuesta.prepare(request)
+    total = 0
+    try:
+        servicio = await obtener_servicio(request.app)
+        async with aclosing(servicio.resolver_menu(imagen, tipo)) as pictogramas:
+            async for pictograma in pictogramas:
+                await respuesta.write(evento_stream(formato, pictograma))
+                total += 1
+        await respuesta.write(evento_stream(formato, {"fin": True, "total": total}, "fin"))
+    except (ConnectionResetError, asyncio.CancelledError):
+        raise
+    except Exception as e:
+        await respuesta.write(evento_stream(formato, {"fin": True, "total": total, "error": str(e)}, "fin"))
+    await respuesta.write_eof()
+    return respuesta
+
+async def webhook_send_image(request: web.Request) -> web.Response:
+    try:
+        formulario = await request.post()
+    except Exception:
+        return web.json_response({"error": "El cuerpo debe ser multipart/form-data"}, status=400)
+    archivo = formulario.get("imagen")
+    if not isinstance(archivo, web.FileField):
+        return web.json_response({"error": "Falta el archivo 'imagen'"}, status=400)
+
+    formato = formato_stream(request)
+    if formato is not None:
+        return await responder_stream(request, formato, archivo.file.read(), archivo.content_type or "image/jpeg")
+
+    try:
+        servicio = await obtener_servicio(request.app)
+        pictogramas = await servicio.pictogramas_de_menu(archivo.file.read(), archivo.content_type or "image/jpeg")
+        return web.json_response(pictogramas)
+    except asyncio.TimeoutError:
+        return web.json_response({"error": "El procesamiento excedió el tiempo límite"}, status=504)
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+@web.middleware
+async def cors(request: web.Request, handler):
+    """El front llama a los webhooks desde otro origen (igual que al webhook de n8n)."""
+    if request.method == "OPTIONS":
+        respuesta = web.Response()
+    else:
+        respuesta = await handler(request)
+        if respuesta.prepared:  # los streams ya mandaron sus encabezados
+            return respuesta
+    respuesta.headers["Access-Control-Allow-Origin"] = CORS_ORIGEN
+    respuesta.headers["Access-Control-Allow-Methods"] = "POST, GET, OPTIONS"
+    respuesta.headers["Access-Control-Allow-Headers"] = "Content-Type"
+    return respuesta
+
+async def salud(request: web.Request) -> web.Response:
+    servicio = request.app["servicio"]
+    respuesta = {"ok": True, "servicio_iniciado": servicio is not None}
+    if servicio is not None:
+        respuesta["embeddings"] = servicio.agrupador.estadisticas()
+        respuesta["busquedas"] = servicio.vuelo_unico.estadisticas()
+    return web.json_response(respuesta)
+
+async def _cerrar_servicio(app: web.Application):
+    if app["servicio"] is not None:
+        await app["servicio"].cerrar()
+
+def crear_app() -> web.Application:
+    app = web.Application(middlewares=[cors], client_max_size=MAX_BYTES_IMAGEN)
+    app["servicio"] = None
+    app["lock_servicio"] = asyncio.Lock()
+    app.router.add_post("/enriquecer", enriquecer)
+    app.router.add_post("/buscar", buscar)
+    app.router.add_get("/salud", salud)
+    app.router.add_post("/webhook/buscar_pictograma", webhook_buscar_pictograma)
+    app.router.add_post("/webhook/send_image", webhook_send_image)
+    app.on_cleanup.append(_cerrar_servicio)
+    return app
+
+if __name__ == "__main__":
+    web.run_app(crear_app(), host=HOST, port=PORT)
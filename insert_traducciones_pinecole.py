@@ -1,13 +1,18 @@
 import json
-import openai
+import os
+import sys
 from pinecone import Pinecone
+from dotenv import load_dotenv
 
-# Configurar API de OpenAI y Pinecone
-INDEX_NAME = "rufusmenu"
+# Los helpers de embeddings compartidos viven en pinecone/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "pinecone"))
+from embeddings import insertar_con_embeddings
 
+load_dotenv()
 
-# Inicializar OpenAI
-openai.api_key = OPENAI_API_KEY
+# Configurar API de Pinecone
+PINECONE_API_KEY = os.environ.get("PINECONE_API_KEY")
+INDEX_NAME = "rufusmenu"
 
 # Inicializar Pinecone
 pc = Pinecone(api_key=PINECONE_API_KEY)
@@ -17,35 +22,24 @@ index = pc.Index(INDEX_NAME)
 with open("ARASAAC-argentino.json", "r", encoding="utf-8") as file:
     data = json.load(file)
 
-# Función para generar embeddings con OpenAI
-def generate_embedding(text):
-    response = openai.embeddings.create(
-        model="text-embedding-ada-002",
-        input=text
-    )
-    return response.data[0].embedding
-
-# **Dividir los datos en lotes de 100**
-BATCH_SIZE = 100  # Número de registros por batch
-vectors = []
-for i, item in enumerate(data):
-    print(item)
-    text = f"{item['nombre del pictograma de ARASAAC']} - {item['traduccion al argentino del nombre del pictograma de ARASAAC']}"
-    vector = generate_embedding(text)
-
-    vectors.append({
+# Número de registros por upsert
+BATCH_SIZE = 100
+
+def construir_texto(item):
+    return f"{item['nombre del pictograma de ARASAAC']} - {item['traduccion al argentino del nombre del pictograma de ARASAAC']}"
+
+def construir_vector(item, vector):
+    return {
         "id": str(item["id del pictograma de ARASAAC"]),
         "values": vector,
         "metadata": {
             "nombre": item["nombre del pictograma de ARASAAC"],
             "traduccion": item["traduccion al argentino del nombre del pictograma de ARASAAC"]
         }
-    })
+    }
 
-    # **Cada 100 registros, subimos a Pinecone y limpiamos la lista**
-    if len(vectors) >= BATCH_SIZE or i == len(data) - 1:
-        index.upsert(vectors=vectors, namespace="traducciones")
-        print(f"Subidos {len(vectors)} vectores a Pinecone...")
-        vectors = []  # Limpiar la lista para el siguiente batch
+# Los embeddings se piden en lotes y cada upsert corre mientras se embebe el lote siguiente
+textos = [construir_texto(item) for item in data]
+insertar_con_embeddings(data, textos, construir_vector, index, "traducciones", tamanio_upsert=BATCH_SIZE)
 
 print("✅ Todos los datos han sido subidos correctamente a Pinecone")
@@ -0,0 +1,191 @@
+import json
+import math
+import os
+from collections import Counter, defaultdict
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+from indice_lexico import plegar, raiz, PALABRAS_VACIAS, desactualizado, leer_registros
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+CORPUS_BM25 = os.environ.get("CORPUS_BM25", os.path.join(DIRECTORIO, "pictogramas_enriquecidos.json"))
+RUTA_INDICE_BM25 = os.path.join(DIRECTORIO, ".indice_bm25.json")
+
+# Peso de cada grupo de campos de construir_texto_enriquecido; se aplican al consultar,
+# así que cambiarlos no requiere reconstruir el índice
+PESOS_CAMPOS = {
+    "nombre": 3.0,
+    "equivalentes": 2.0,
+    "ingredientes": 1.0,
+    "categoria": 1.0,
+    "definicion": 0.5,
+    "otros": 0.3,
+}
+K1 = 1.2
+B = 0.75
+K_RRF = 60
+
+def tokenizar(texto: str) -> List[str]:
+    return [raiz(p) for p in plegar(texto).split() if p not in PALABRAS_VACIAS and not p.isdigit()]
+
+def _texto(valor: Any) -> str:
+    if isinstance(valor, list):
+        return " ".join(str(v) for v in valor if isinstance(v, str))
+    return str(valor) if valor else ""
+
+def campos_documento(p: Dict[str, Any]) -> Dict[str, str]:
+    """Agrupa los mismos campos que usa construir_texto_enriquecido."""
+    return {
+        "nombre": _texto(p.get("nombre del pictograma", p.get("nombre"))),
+        "equivalentes": _texto(p.get("equivalentes")),
+        "ingredientes": _texto(p.get("ingredientes")),
+        "categoria": f"{_texto(p.get('categoria'))} {_texto(p.get('subcategoria'))}",
+        "definicion": _texto(p.get("definicion")),
+        "otros": " ".join(_texto(p.get(c)) for c in ("forma_de_servir", "origen", "tipo_de_coccion")),
+    }
+
+def metadata_resultado(p: Dict[str, Any]) -> Dict[str, Any]:
+    """Los campos que devuelve buscar_pictograma, para documentos que solo encuentra BM25."""
+    nombres = p.get("nombre del pictograma", p.get("nombre", ""))
+    metadata = {"nombre del pictograma": ", ".join(nombres) if isinstance(nombres, list) else str(nombres)}
+    for campo in ("definicion", "categoria", "subcategoria"):
+        if p.get(campo) is not None:
+            metadata[campo] = str(p[campo])
+    if isinstance(p.get("equivalentes"), list):
+        metadata["equivalentes"] = [str(v) for v in p["equivalentes"] if isinstance(v, str)]
+    return metadata
+
+
+class IndiceBM25:
+    """
+    BM25F sobre el texto enriquecido de los pictogramas: la frecuencia de cada
+    término se pondera por campo (PESOS_CAMPOS) antes de saturarla.
+    Se persiste ya tokenizado (postings por campo y largos de documento) para
+    que cargarlo no implique re-tokenizar el corpus. La normalización por largo
+    de cada documento se calcula una vez por juego de pesos y se reutiliza.
+    """
+
+    def __init__(self):
+        self.ids: List[int] = []
+        self.metadata: List[Dict[str, Any]] = []
+        self.postings: Dict[str, Dict[str, Dict[str, int]]] = {}  # término -> doc -> campo -> tf
+        self.largos: List[Dict[str, int]] = []  # doc -> campo -> cantidad de tokens
+        self.corpus = ""
+        self._normas: Dict[Tuple[Tuple[str, float], ...], List[float]] = {}  # pesos -> doc -> K1 * (1 - B + B * largo / promedio)
+
+    @classmethod
+    def construir(cls, registros: Iterable[Dict[str, Any]]) -> "IndiceBM25":
+        indice = cls()
+        postings = defaultdict(lambda: defaultdict(dict))
+        vistos = set()
+        for p in registros:
+            id_picto = p.get("id del pictograma de ARASAAC")
+            if id_picto is None or int(id_picto) in vistos:
+                continue
+            vistos.add(int(id_picto))
+            doc = str(len(indice.ids))
+            largos = {}
+            for campo, texto in campos_documento(p).items():
+                tokens = tokenizar(texto)
+                largos[campo] = len(tokens)
+                for termino, tf in Counter(tokens).items():
+                    postings[termino][doc][campo] = tf
+            indice.ids.append(int(id_picto))
+            indice.metadata.append(metadata_resultado(p))
+            indice.largos.append(largos)
+        indice.postings = {t: dict(docs) for t, docs in postings.items()}
+        indice.normas(PESOS_CAMPOS)
+        return indice
+
+    def normas(self, pesos: Dict[str, float]) -> List[float]:
+        """Término de normalización por largo de cada documento con estos pesos de campo."""
+        clave = tuple(sorted(pesos.items()))
+        normas = self._normas.get(clave)
+        if normas is None:
+            largos = [sum(pesos.get(c, 0.0) * l for c, l in doc.items()) for doc in self.largos]
+            promedio = (sum(largos) / len(largos) if largos else 0.0) or 1.0
+            normas = self._normas[clave] = [K1 * (1 - B + B * largo / promedio) for largo in largos]
+        return normas
+
+    def buscar(self, consulta: str, top_k: int = 20,
+               pesos: Optional[Dict[str, float]] = None) -> List[Tuple[int, float]]:
+        """Devuelve [(posición del documento, score)] ordenado de mayor a menor."""
+        pesos = pesos or PESOS_CAMPOS
+        n = len(self.ids)
+        if n == 0:
+            return []
+        normas = self.normas(pesos)
+
+        scores = defaultdict(float)
+        for termino in set(tokenizar(consulta)):
+            docs = self.postings.get(termino)
+            if not docs:
+                continue
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc, tfs in docs.items():
+                d = int(doc)
+                tf = sum(pesos.get(c, 0.0) * f for c, f in tfs.items())
+                scores[d] += idf * tf * (K1 + 1) / (tf + normas[d])
+        return sorted(scores.items(), key=lambda x: -x[1])[:top_k]
+
+    def guardar(self, ruta: str):
+        with open(ruta + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"corpus": self.corpus, "ids": self.ids, "metadata": self.metadata,
+                       "postings": self.postings, "largos": self.largos}, f, ensure_ascii=False)
+        os.replace(ruta + ".tmp", ruta)
+
+    @classmethod
+    def cargar(cls, ruta: str) -> "IndiceBM25":
+        with open(ruta, "r", encoding="utf-8") as f:
+            datos = json.load(f)
+        indice = cls()
+        indice.corpus = datos.get("corpus", "")
+        indice.ids = datos["ids"]
+        indice.metadata = datos["metadata"]
+        indice.postings = datos["postings"]
+        indice.largos = datos["largos"]
+        indice.normas(PESOS_CAMPOS)
+        return indice
+
+
+def fusion_rrf(rankings: List[List[Any]], k: int = K_RRF) -> List[Tuple[Any, float]]:
+    """Reciprocal-rank fusion: score(d) = sum(1 / (k + posición de d en cada ranking))."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for posicion, clave in enumerate(ranking):
+            scores[clave] += 1.0 / (k + posicion + 1)
+    return sorted(scores.items(), key=lambda x: -x[1])
+
+_indice: Optional[IndiceBM25] = None
+
+def obtener_indice_bm25(corpus: str = CORPUS_BM25, ruta: str = RUTA_INDICE_BM25) -> IndiceBM25:
+    """Carga el índice BM25 precomputado; lo reconstruye solo si el corpus es más nuevo."""
+    global _indice
+    if _indice is None or _indice.corpus != corpus:
+        _indice = None if desactualizado(ruta, [corpus]) else IndiceBM25.cargar(ruta)
+        if _indice is None or _indice.corpus != corpus:
+            _indice = IndiceBM25.construir(leer_registros([corpus]))
+            _indice.corpus = corpus
+            _indice.guardar(ruta)
+    return _indice
+
+def fusionar_resultados(consulta: str, densos: List[Dict[str, Any]], candidatos: int,
+                        pesos: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+    """
+    Fusiona por RRF los pictogramas de la búsqueda vectorial con los de BM25.
+    `score` sigue siendo el coseno denso (0.0 si el pictograma solo apareció por BM25);
+    el orden lo da `score_rrf`.
+    """
+    indice = obtener_indice_bm25()
+    lexicos = indice.buscar(consulta, candidatos, pesos)
+
+    por_id = {p["id del pictograma de ARASAAC"]: p for p in densos}
+    ranking_bm25 = []
+    for doc, score in lexicos:
+        id_picto = indice.ids[doc]
+        if id_picto not in por_id:
+            por_id[id_picto] = {"id del pictograma de ARASAAC": id_picto, "score": 0.0, **indice.metadata[doc]}
+        por_id[id_picto]["score_bm25"] = score
+        ranking_bm25.append(id_picto)
+
+    ranking_denso = [p["id del pictograma de ARASAAC"] for p in densos]
+    return [dict(por_id[id_picto], score_rrf=score) for id_picto, score in fusion_rrf([ranking_denso, ranking_bm25])]
@@ -0,0 +1,155 @@
+import copy
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Callable, Optional
+
+RUTA_CACHE_BUSQUEDAS = os.environ.get(
+    "BUSQUEDAS_CACHE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache_busquedas.sqlite3")
+)
+MAX_ENTRADAS_MEMORIA = 2048
+TTL_FRESCO = 6 * 3600  # segundos en que un resultado se sirve sin más
+TTL_OBSOLETO = 7 * 24 * 3600  # ventana extra en que se sirve viejo y se refresca en segundo plano
+TTL_NEGATIVO = 15 * 60  # consultas sin coincidencia confiable se reintentan antes
+
+def normalizar_consulta(consulta: str) -> str:
+    """Minúsculas, sin espacios repetidos ni puntuación en los extremos: 'Milanesa ' == 'milanesa'."""
+    consulta = re.sub(r"\s+", " ", consulta.strip().lower())
+    return consulta.strip(" .,;:!?¡¿\"'")
+
+
+class CacheBusquedas:
+    """
+    Cache de resultados de búsqueda en dos niveles: LRU en memoria y SQLite en disco.
+
+    La clave incluye la versión del contenido del namespace, así que cualquier
+    cambio en el índice invalida las entradas viejas sin borrarlas a mano.
+    Las entradas vencidas pero dentro de TTL_OBSOLETO se devuelven igual y se
+    recalculan en segundo plano (stale-while-revalidate).
+    """
+
+    def __init__(self, ruta: str = RUTA_CACHE_BUSQUEDAS,
+                 max_memoria: int = MAX_ENTRADAS_MEMORIA,
+                 ttl_fresco: float = TTL_FRESCO,
+                 ttl_obsoleto: float = TTL_OBSOLETO,
+                 ttl_negativo: float = TTL_NEGATIVO):
+        self.max_memoria = max_memoria
+        self.ttl_fresco = ttl_fresco
+        self.ttl_obsoleto = ttl_obsoleto
+        self.ttl_negativo = ttl_negativo
+        self.hits = 0
+        self.obsoletos = 0
+        self.misses = 0
+        self._memoria = OrderedDict()
+        self._refrescando = set()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="refresco-busquedas")
+        self._conn = sqlite3.connect(ruta, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS busquedas ("
+            " clave TEXT PRIMARY KEY,"
+            " valor TEXT NOT NULL,"
+            " negativo INTEGER NOT NULL,"
+            " guardado REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def clave(consulta: str, namespace: str, top_k: int, version: str) -> str:
+        return json.dumps([normalizar_consulta(consulta), namespace, top_k, version], ensure_ascii=False)
+
+    def _leer(self, clave: str) -> Optional[tuple]:
+        with self._lock:
+            entrada = self._memoria.get(clave)
+            if entrada is not None:
+                self._memoria.move_to_end(clave)
+                return entrada
+            fila = self._conn.execute(
+                "SELECT valor, negativo, guardado FROM busquedas WHERE clave = ?", (clave,)
+            ).fetchone()
+            if fila is None:
+                return None
+            entrada = (json.loads(fila[0]), bool(fila[1]), fila[2])
+            self._guardar_memoria(clave, entrada)
+            return entrada
+
+    def _guardar_memoria(self, clave: str, entrada: tuple):
+        self._memoria[clave] = entrada
+        self._memoria.move_to_end(clave)
+        while len(self._memoria) > self.max_memoria:
+            self._memoria.popitem(last=False)
+
+    def guardar(self, clave: str, valor: List[Dict[str, Any]], negativo: bool):
+        entrada = (copy.deepcopy(valor), negativo, time.time())
+        with self._lock:
+            self._guardar_memoria(clave, entrada)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO busquedas VALUES (?, ?, ?, ?)",
+                (clave, json.dumps(valor, ensure_ascii=False), int(negativo), entrada[2])
+            )
+            self._conn.commit()
+
+    def _refrescar(self, clave: str, calcular: Callable[[], List[Dict[str, Any]]],
+                   es_negativo: Callable[[List[Dict[str, Any]]], bool]):
+        try:
+            valor = calcular()
+            self.guardar(clave, valor, es_negativo(valor))
+        except Exception as e:
+            print(f"⚠️ No se pudo refrescar la búsqueda cacheada: {e}")
+        finally:
+            with self._lock:
+                self._refrescando.discard(clave)
+
+    def consultar(self, consulta: str, namespace: str, top_k: int, version: str,
+                  calcular: Callable[[], List[Dict[str, Any]]],
+                  es_negativo: Callable[[List[Dict[str, Any]]], bool] = lambda r: not r
+                  ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Devuelve el resultado cacheado o None si no hay uno utilizable.
+        Si la entrada está vencida pero dentro de la ventana de obsolescencia,
+        se devuelve igual y `calcular` se ejecuta en segundo plano para refrescarla.
+        """
+        clave = self.clave(consulta, namespace, top_k, version)
+        entrada = self._leer(clave)
+        if entrada is None:
+            self.misses += 1
+            return None
+        valor, negativo, guardado = entrada
+        edad = time.time() - guardado
+        ttl = self.ttl_negativo if negativo else self.ttl_fresco
+        if edad < ttl:
+            self.hits += 1
+            return copy.deepcopy(valor)
+        if not negativo and edad < ttl + self.ttl_obsoleto:
+            self.obsoletos += 1
+            with self._lock:
+                refrescar = clave not in self._refrescando
+                self._refrescando.add(clave)
+            if refrescar:
+                self._pool.submit(self._refrescar, clave, calcular, es_negativo)
+            return copy.deepcopy(valor)
+        self.misses += 1
+        return None
+
+    def obtener_o_calcular(self, consulta: str, namespace: str, top_k: int, version: str,
+                           calcular: Callable[[], List[Dict[str, Any]]],
+                           es_negativo: Callable[[List[Dict[str, Any]]], bool] = lambda r: not r
+                           ) -> List[Dict[str, Any]]:
+        valor = self.consultar(consulta, namespace, top_k, version, calcular, es_negativo)
+        if valor is not None:
+            return valor
+        valor = calcular()
+        self.guardar(self.clave(consulta, namespace, top_k, version), valor, es_negativo(valor))
+        return valor
+
+    def estadisticas(self) -> Dict[str, int]:
+        return {"hits": self.hits, "obsoletos": self.obsoletos, "misses": self.misses,
+                "en_memoria": len(self._memoria)}
+
@@ -0,0 +1,125 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Any, Iterable, Optional
+
+from indice_lexico import plegar, leer_registros
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+RUTA_CACHE_ENRIQUECIMIENTO = os.environ.get(
+    "ENRIQUECIMIENTO_CACHE", os.path.join(DIRECTORIO, ".cache_enriquecimiento.sqlite3")
+)
+# Salidas de enriquecimientos anteriores con las que se precarga el cache
+CORPUS_ENRIQUECIDOS = [
+    os.path.join(DIRECTORIO, "pictogramas_enriquecidos.json"),
+    os.path.join(DIRECTORIO, "pictogramas_enriquecidos2.json"),
+]
+CAMPOS_ENRIQUECIDOS = ["definicion", "categoria", "subcategoria", "origen", "tipo_de_coccion",
+                       "ingredientes", "forma_de_servir", "equivalentes"]
+
+def clave_nombre(nombre: Any) -> str:
+    """
+    Misma normalización que normalizar_nombre de los scripts (primer nombre,
+    hasta la primera coma) y además sin tildes ni mayúsculas:
+    ['Puré de papas, puré'] -> 'pure de papas'.
+    """
+    if isinstance(nombre, list):
+        nombre = nombre[0] if nombre else ""
+    return plegar(str(nombre).split(",")[0])
+
+
+class CacheEnriquecimiento:
+    """
+    Resultados de enriquecimiento por plato, compartidos entre corridas y
+    archivos de entrada. Los catálogos repiten el mismo plato con distintos
+    ids de ARASAAC; con este cache cada plato se pide a la API una sola vez.
+    """
+
+    def __init__(self, ruta: str = RUTA_CACHE_ENRIQUECIMIENTO):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(ruta, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS enriquecimientos ("
+            " clave TEXT PRIMARY KEY,"
+            " resultado TEXT NOT NULL,"
+            " guardado REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def obtener_muchos(self, claves: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Devuelve {clave: resultado} para las claves que están en el cache."""
+        encontrados = {}
+        with self._lock:
+            for i in range(0, len(claves), 500):
+                parte = claves[i:i+500]
+                filas = self._conn.execute(
+                    f"SELECT clave, resultado FROM enriquecimientos WHERE clave IN ({','.join('?' * len(parte))})",
+                    parte
+                ).fetchall()
+                encontrados.update((clave, json.loads(resultado)) for clave, resultado in filas)
+        self.hits += len(encontrados)
+        self.misses += len(set(claves)) - len(encontrados)
+        return encontrados
+
+    def guardar(self, clave: str, resultado: Dict[str, Any]):
+        self.guardar_muchos({clave: resultado})
+
+    def guardar_muchos(self, resultados: Dict[str, Dict[str, Any]]):
+        """Guarda varios platos en una sola transacción."""
+        if not resultados:
+            return
+        ahora = time.time()
+        filas = [(clave, json.dumps(resultado, ensure_ascii=False), ahora) for clave, resultado in resultados.items()]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO enriquecimientos (clave, resultado, guardado) VALUES (?, ?, ?)", filas
+            )
+            self._conn.commit()
+
+    def sembrar(self, pictogramas: Iterable[Dict[str, Any]], campos: List[str] = CAMPOS_ENRIQUECIDOS) -> int:
+        """
+        Precarga el cache con pictogramas ya enriquecidos (los que tienen todos
+        los `campos`), sin pisar entradas existentes. Devuelve cuántas se agregaron.
+        """
+        filas = {}
+        ahora = time.time()
+        for p in pictogramas:
+            if not all(campo in p for campo in campos):
+                continue
+            nombre = p.get("nombre del pictograma", p.get("nombre"))
+            clave = clave_nombre(nombre)
+            if clave and clave not in filas:
+                resultado = {"nombre": nombre[0] if isinstance(nombre, list) else nombre}
+                resultado.update((campo, p[campo]) for campo in campos)
+                filas[clave] = (clave, json.dumps(resultado, ensure_ascii=False), ahora)
+        with self._lock:
+            antes = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO enriquecimientos (clave, resultado, guardado) VALUES (?, ?, ?)",
+                list(filas.values())
+            )
+            self._conn.commit()
+            return self._conn.total_changes - antes
+
+    def estadisticas(self) -> Dict[str, int]:
+        with self._lock:
+            entradas = self._conn.execute("SELECT COUNT(*) FROM enriquecimientos").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entradas": entradas}
+
+
+_cache: Optional[CacheEnriquecimiento] = None
+
+def obtener_cache_enriquecimiento(corpus: List[str] = CORPUS_ENRIQUECIDOS) -> CacheEnriquecimiento:
+    """Cache compartido del proceso, precargado con los enriquecimientos ya hechos."""
+    global _cache
+    if _cache is None:
+        _cache = CacheEnriquecimiento()
+        agregados = _cache.sembrar(leer_registros(corpus))
+        if agregados:
+            print(f"🗃️ Cache de enriquecimiento: {agregados} platos precargados de {len(corpus)} archivos")
+    return _cache
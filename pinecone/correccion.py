@@ -0,0 +1,164 @@
+import os
+import re
+from collections import Counter, defaultdict
+from typing import List, Dict, Any, Iterable, Optional, Set
+
+from indice_lexico import FUENTES_LEXICAS, CAMPOS_NOMBRE, plegar, extraer_nombres, leer_registros
+
+LARGO_MINIMO = 4  # palabras más cortas no se corrigen ("te", "pan", "ron")
+DISTANCIA_MAXIMA = 2
+# Archivo opcional con palabras del español (una por línea) que nunca se corrigen
+RUTA_VOCABULARIO_ESPANOL = os.environ.get("VOCABULARIO_ESPANOL")
+# Palabras frecuentes en cartas que no son nombres de pictogramas: están bien escritas
+# aunque falten en el catálogo ('entraña' no es 'entrada', 'cortado' no es 'cortador')
+PALABRAS_COMUNES = {
+    "entrana", "casera", "casero", "caseras", "caseros", "cortado", "cortada", "caesar", "cesar",
+    "grillado", "grillada", "grillados", "grilladas", "gratinado", "gratinada", "gratinados", "gratinadas",
+    "salteado", "salteada", "salteados", "salteadas", "braseado", "braseada", "ahumado", "ahumada",
+    "rebozado", "rebozada", "apanado", "apanada", "confitado", "confitada", "glaseado", "glaseada",
+    "relleno", "rellena", "rellenos", "rellenas", "crocante", "crocantes", "tibio", "tibia",
+    "fresco", "fresca", "frescos", "frescas", "clasico", "clasica", "completo", "completa",
+    "especial", "especiales", "artesanal", "artesanales", "porcion", "porciones", "media", "medio",
+    "chico", "chica", "grande", "mediano", "mediana", "guarnicion", "guarniciones", "opcion", "opciones",
+    "menu", "casa", "chef", "estilo", "plancha", "horno", "parrilla", "vapor", "frito", "frita",
+    "fritos", "fritas", "hervido", "hervida", "crudo", "cruda", "vegano", "vegana", "vegetariano",
+    "vegetariana", "integral", "doble", "simple", "triple", "caliente", "fria", "frio", "light",
+}
+
+def _distancia_maxima(palabra: str) -> int:
+    return 1 if len(palabra) < 7 else DISTANCIA_MAXIMA
+
+def _borrados(palabra: str, distancia: int) -> Set[str]:
+    """Todas las variantes de `palabra` con hasta `distancia` letras borradas."""
+    variantes = {palabra}
+    frontera = {palabra}
+    for _ in range(distancia):
+        frontera = {p[:i] + p[i+1:] for p in frontera for i in range(len(p))}
+        variantes |= frontera
+    return variantes
+
+def leer_vocabulario(ruta: Optional[str]) -> Set[str]:
+    if not ruta or not os.path.exists(ruta):
+        return set()
+    with open(ruta, "r", encoding="utf-8") as f:
+        return {plegar(linea) for linea in f if plegar(linea)}
+
+def _textos(valor: Any) -> Iterable[str]:
+    if isinstance(valor, str):
+        yield valor
+    elif isinstance(valor, list):
+        for v in valor:
+            yield from _textos(v)
+
+def distancia_edicion(a: str, b: str) -> int:
+    """Damerau-Levenshtein restringida (inserción, borrado, sustitución y transposición)."""
+    anterior2 = None
+    anterior = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        actual = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            costo = 0 if a[i-1] == b[j-1] else 1
+            actual[j] = min(anterior[j] + 1, actual[j-1] + 1, anterior[j-1] + costo)
+            if i > 1 and j > 1 and a[i-1] == b[j-2] and a[i-2] == b[j-1]:
+                actual[j] = min(actual[j], anterior2[j-2] + 1)
+        anterior2, anterior = anterior, actual
+    return anterior[len(b)]
+
+
+class CorrectorOrtografico:
+    """
+    Corrector por borrado simétrico (SymSpell) sobre el vocabulario del catálogo.
+    Se precalculan los borrados de cada palabra conocida; para corregir se
+    generan los borrados de la palabra de la consulta y solo se comparan los
+    candidatos que comparten alguno, así que una consulta cuesta microsegundos.
+
+    Solo se corrigen palabras que no aparecen en ningún texto del catálogo
+    (nombres, definiciones, ingredientes...) ni en el vocabulario del español:
+    una palabra válida que no es nombre de pictograma se deja como está.
+    """
+
+    def __init__(self):
+        self.frecuencias: Counter = Counter()
+        self.validas: Set[str] = set(PALABRAS_COMUNES)  # palabras bien escritas que no se corrigen
+        self.formas: Dict[str, str] = {}  # forma plegada -> forma original más frecuente
+        self.borrados: Dict[str, List[str]] = {}
+
+    @classmethod
+    def construir(cls, registros: Iterable[Dict[str, Any]]) -> "CorrectorOrtografico":
+        corrector = cls()
+        superficies = defaultdict(Counter)
+        for registro in registros:
+            for valor in registro.values():
+                for texto in _textos(valor):
+                    corrector.validas.update(plegar(texto).split())
+            for campo in CAMPOS_NOMBRE:
+                for nombre in extraer_nombres(registro.get(campo)):
+                    for original in re.findall(r"\w+", nombre.lower()):
+                        plegada = plegar(original)
+                        if plegada and not plegada.isdigit():
+                            corrector.frecuencias[plegada] += 1
+                            superficies[plegada][original] += 1
+        corrector.formas = {p: c.most_common(1)[0][0] for p, c in superficies.items()}
+        corrector.validas |= leer_vocabulario(RUTA_VOCABULARIO_ESPANOL)
+
+        borrados = defaultdict(list)
+        for palabra in corrector.frecuencias:
+            if len(palabra) < LARGO_MINIMO:
+                continue
+            for variante in _borrados(palabra, _distancia_maxima(palabra)):
+                borrados[variante].append(palabra)
+        corrector.borrados = dict(borrados)
+        return corrector
+
+    def candidatos(self, palabra: str) -> List[str]:
+        """Palabras del vocabulario a distancia mínima de `palabra`, de más a menos frecuente."""
+        palabra = plegar(palabra)
+        if palabra in self.frecuencias:
+            return [palabra]
+        if len(palabra) < LARGO_MINIMO:
+            return []
+        maxima = _distancia_maxima(palabra)
+        vistos = set()
+        mejores, mejor_distancia = [], maxima + 1
+        for variante in _borrados(palabra, maxima):
+            for conocida in self.borrados.get(variante, ()):
+                if conocida in vistos:
+                    continue
+                vistos.add(conocida)
+                d = distancia_edicion(palabra, conocida)
+                if d > maxima:
+                    # Comparte un borrado pero está más lejos que el límite ('casera' / 'cascara')
+                    continue
+                if d < mejor_distancia:
+                    mejores, mejor_distancia = [conocida], d
+                elif d == mejor_distancia:
+                    mejores.append(conocida)
+        return sorted(mejores, key=lambda p: -self.frecuencias[p])
+
+    def corregir(self, consulta: str) -> str:
+        """
+        Reemplaza las palabras desconocidas por la conocida más cercana.
+        Las palabras conocidas se dejan como vinieron; las corregidas toman la
+        grafía del catálogo ('milaneza' -> 'milanesa', 'lech' -> 'leche').
+        Es una propuesta: quien busca solo la usa si encuentra algo que la
+        consulta original no encontraba (ver coincidencias_lexicas).
+        """
+        def reemplazar(m: re.Match) -> str:
+            palabra = m.group(0)
+            plegada = plegar(palabra)
+            if not plegada or plegada.isdigit() or plegada in self.frecuencias or plegada in self.validas:
+                return palabra
+            opciones = self.candidatos(plegada)
+            if not opciones:
+                return palabra
+            return self.formas.get(opciones[0], opciones[0])
+        return re.sub(r"\w+", reemplazar, consulta)
+
+
+_corrector: Optional[CorrectorOrtografico] = None
+
+def obtener_corrector(fuentes: List[str] = FUENTES_LEXICAS) -> CorrectorOrtografico:
+    global _corrector
+    if _corrector is None:
+        _corrector = CorrectorOrtografico.construir(leer_registros(fuentes))
+    return _corrector
@@ -0,0 +1,165 @@
+import json
+import os
+import queue
+import threading
+from typing import List, Dict, Any, Optional
+
+CLAVE_ID = "id del pictograma de ARASAAC"
+
+
+class DiarioEnriquecimiento:
+    """
+    Diario de checkpoints del enriquecimiento: un pictograma enriquecido por
+    línea (JSONL), agregado al final y sincronizado con fsync. Cada checkpoint
+    cuesta lo que mide un pictograma, no el archivo completo, y un corte a mitad
+    de escritura deja a lo sumo una última línea incompleta que se descarta al
+    reanudar. El JSON final se arma aparte con `compactar`.
+    """
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+
+    def _recortar_cola(self):
+        """Descarta una última línea incompleta para que la próxima no quede pegada a ella."""
+        if not os.path.exists(self.ruta):
+            return
+        with open(self.ruta, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            largo = f.tell()
+            if largo == 0:
+                return
+            f.seek(largo - 1)
+            if f.read(1) == b"\n":
+                return
+            # Buscar hacia atrás el último salto de línea
+            posicion = largo
+            while posicion > 0:
+                paso = min(4096, posicion)
+                f.seek(posicion - paso)
+                bloque = f.read(paso)
+                corte = bloque.rfind(b"\n")
+                if corte != -1:
+                    posicion = posicion - paso + corte + 1
+                    break
+                posicion -= paso
+            f.truncate(posicion)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def registrar(self, pictogramas: List[Dict[str, Any]]):
+        """Agrega los pictogramas al diario; vuelve recién cuando están en disco."""
+        if not pictogramas:
+            return
+        lineas = "".join(json.dumps(p, ensure_ascii=False) + "\n" for p in pictogramas)
+        with self._lock:
+            self._recortar_cola()
+            with open(self.ruta, "a", encoding="utf-8") as f:
+                f.write(lineas)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def reproducir(self) -> Dict[Any, Dict[str, Any]]:
+        """
+        Lee el diario y devuelve {id: pictograma}, en orden de primera aparición.
+        Si un id aparece varias veces gana la última versión.
+        """
+        entradas: Dict[Any, Dict[str, Any]] = {}
+        if not os.path.exists(self.ruta):
+            return entradas
+        with open(self.ruta, "r", encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    picto = json.loads(linea)
+                except json.JSONDecodeError:
+                    # Línea cortada por una caída durante la escritura
+                    continue
+                entradas[picto.get(CLAVE_ID)] = picto
+        return entradas
+
+    def compactar(self, ruta_salida: str, base: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """
+        Escribe `ruta_salida` con `base` actualizado por el diario: los ids que
+        ya estaban se reemplazan en su lugar y los nuevos se agregan al final.
+        La escritura es atómica (archivo temporal + os.replace).
+        """
+        entradas = self.reproducir()
+        resultado = []
+        vistos = set()
+        for picto in base or []:
+            id_picto = picto.get(CLAVE_ID)
+            resultado.append(entradas.get(id_picto, picto))
+            vistos.add(id_picto)
+        resultado.extend(p for id_picto, p in entradas.items() if id_picto not in vistos)
+
+        temporal = ruta_salida + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, ruta_salida)
+        return resultado
+
+    def vaciar(self):
+        """Borra el diario; se llama una vez que `compactar` dejó todo en el JSON final."""
+        with self._lock:
+            if os.path.exists(self.ruta):
+                os.remove(self.ruta)
+
+
+_FIN = object()
+
+
+class EscritorDiario:
+    """
+    Escribe el diario y el cache de enriquecimiento desde un hilo propio, para
+    que el fsync y el commit de SQLite no frenen el loop que recibe las
+    respuestas del modelo. Cada vuelta toma todo lo que se encoló mientras
+    tanto y lo baja con un solo fsync y una sola transacción.
+    """
+
+    def __init__(self, diario: DiarioEnriquecimiento, cache=None):
+        self.diario = diario
+        self.cache = cache
+        self.escrituras = 0
+        self._cola: queue.Queue = queue.Queue()
+        self._error: Optional[BaseException] = None
+        self._hilo = threading.Thread(target=self._escribir, name="escritor-diario", daemon=True)
+        self._hilo.start()
+
+    def encolar(self, pictogramas: List[Dict[str, Any]], clave: Optional[str] = None,
+                resultado: Optional[Dict[str, Any]] = None):
+        """Agrega pictogramas al diario y, si viene `clave`, guarda `resultado` en el cache."""
+        if self._error is not None:
+            raise self._error
+        self._cola.put((pictogramas, clave, resultado))
+
+    def _escribir(self):
+        terminar = False
+        while not terminar:
+            pendientes = [self._cola.get()]
+            while True:
+                try:
+                    pendientes.append(self._cola.get_nowait())
+                except queue.Empty:
+                    break
+            if pendientes[-1] is _FIN:
+                terminar = True
+                pendientes.pop()
+            if self._error is not None or not pendientes:
+                continue
+            try:
+                if self.cache is not None:
+                    self.cache.guardar_muchos({clave: resultado for _, clave, resultado in pendientes
+                                               if clave is not None})
+                self.diario.registrar([p for pictogramas, _, _ in pendientes for p in pictogramas])
+                self.escrituras += 1
+            except Exception as e:
+                self._error = e
+
+    def cerrar(self):
+        """Espera a que todo lo encolado esté en disco; levanta el error de escritura si lo hubo."""
+        self._cola.put(_FIN)
+        self._hilo.join()
+        if self._error is not None:
+            raise self._error
@@ -0,0 +1,340 @@
+import os
+import hashlib
+import json
+import random
+import sqlite3
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Callable, Iterator
+
+from openai import OpenAI
+from dotenv import load_dotenv
+
+from registro_indices import publicar_version
+
+load_dotenv()
+
+MODELO_EMBEDDING = "text-embedding-ada-002"
+MAX_ITEMS_POR_LOTE = 256  # la API acepta hasta 2048 entradas por llamada
+MAX_TOKENS_POR_LOTE = 100_000  # la API corta en 300k tokens por llamada
+MAX_TOKENS_POR_TEXTO = 8191  # límite de contexto de ada-002 por entrada
+
+RUTA_CACHE = os.environ.get(
+    "EMBEDDINGS_CACHE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache_embeddings.sqlite3")
+)
+MAX_BYTES_CACHE = int(os.environ.get("EMBEDDINGS_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+MAX_BYTES_UPSERT = 1_500_000  # Pinecone rechaza pedidos de más de 2 MB
+MAX_VECTORES_UPSERT = 1000  # y de más de 1000 vectores
+HILOS_UPSERT = int(os.environ.get("HILOS_UPSERT", 4))
+MAX_INTENTOS_UPSERT = 4
+ESPERA_BASE_UPSERT = 1.0  # segundos
+
+_cliente = None
+_cache = None
+
+def obtener_cliente() -> OpenAI:
+    """Crea el cliente de OpenAI la primera vez que se necesita."""
+    global _cliente
+    if _cliente is None:
+        _cliente = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+    return _cliente
+
+class CacheEmbeddings:
+    """
+    Cache persistente de embeddings direccionado por contenido.
+    La clave es sha256(modelo + texto exacto); los vectores se guardan como float32
+    (6 KB por vector de 1536 dimensiones) y al superar `max_bytes` se descartan
+    los menos usados recientemente. El tamaño total se lleva en memoria; solo
+    se vuelve a sumar en SQLite cuando parece superado (otro proceso pudo
+    escribir en el mismo archivo).
+    """
+
+    def __init__(self, ruta: str = RUTA_CACHE, max_bytes: int = MAX_BYTES_CACHE):
+        self.ruta = ruta
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(ruta, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " clave TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " ultimo_acceso REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self._bytes = self._sumar_bytes()
+
+    def _sumar_bytes(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def clave(texto: str, modelo: str) -> str:
+        return hashlib.sha256(f"{modelo}\0{texto}".encode("utf-8")).hexdigest()
+
+    def obtener_muchos(self, textos: List[str], modelo: str) -> List[Any]:
+        """Devuelve el vector cacheado de cada texto, o None si no está."""
+        claves = [self.clave(t, modelo) for t in textos]
+        encontrados = {}
+        with self._lock:
+            for i in range(0, len(claves), 500):
+                parte = claves[i:i+500]
+                filas = self._conn.execute(
+                    f"SELECT clave, vector FROM embeddings WHERE clave IN ({','.join('?' * len(parte))})",
+                    parte
+                ).fetchall()
+                encontrados.update(filas)
+            if encontrados:
+                ahora = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET ultimo_acceso = ? WHERE clave = ?",
+                    [(ahora, c) for c in encontrados]
+                )
+                self._conn.commit()
+            self.hits += len(encontrados)
+            self.misses += len(claves) - len(encontrados)
+
+        return [array("f", encontrados[c]).tolist() if c in encontrados else None for c in claves]
+
+    def guardar_muchos(self, textos: List[str], embeddings: List[List[float]], modelo: str):
+        ahora = time.time()
+        filas = [(self.clave(t, modelo), array("f", e).tobytes(), ahora) for t, e in zip(textos, embeddings)]
+        with self._lock:
+            # Los reemplazos solo suman la diferencia con el vector anterior
+            reemplazados = 0
+            for i in range(0, len(filas), 500):
+                parte = [fila[0] for fila in filas[i:i+500]]
+                reemplazados += self._conn.execute(
+                    f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings WHERE clave IN ({','.join('?' * len(parte))})",
+                    parte
+                ).fetchone()[0]
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", filas)
+            self._conn.commit()
+            self._bytes += sum(len(fila[1]) for fila in {fila[0]: fila for fila in filas}.values()) - reemplazados
+            if self._bytes > self.max_bytes:
+                self._desalojar()
+
+    def _desalojar(self):
+        total = self._bytes = self._sumar_bytes()
+        if total <= self.max_bytes:
+            return
+        # Liberamos hasta el 90% del máximo para no desalojar en cada inserción
+        a_liberar = total - int(self.max_bytes * 0.9)
+        liberado = 0
+        claves = []
+        for clave, tamanio in self._conn.execute(
+                "SELECT clave, LENGTH(vector) FROM embeddings ORDER BY ultimo_acceso"):
+            claves.append((clave,))
+            liberado += tamanio
+            if liberado >= a_liberar:
+                break
+        self._conn.executemany("DELETE FROM embeddings WHERE clave = ?", claves)
+        self._conn.commit()
+        self._bytes -= liberado
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            entradas, tamanio = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entradas": entradas, "bytes": tamanio}
+
+def obtener_cache() -> CacheEmbeddings:
+    global _cache
+    if _cache is None:
+        _cache = CacheEmbeddings()
+    return _cache
+
+def estimar_tokens(texto: str) -> int:
+    """
+    Estimación conservadora de tokens sin depender de tiktoken.
+    En español ada-002 promedia ~4 caracteres por token; usamos 3 para no pasarnos.
+    """
+    return len(texto) // 3 + 1
+
+def particionar_lotes(textos: List[str],
+                      max_items: int = MAX_ITEMS_POR_LOTE,
+                      max_tokens: int = MAX_TOKENS_POR_LOTE) -> Iterator[List[int]]:
+    """
+    Agrupa los índices de `textos` en lotes limitados por cantidad de
+    elementos y por presupuesto de tokens estimados.
+    """
+    lote = []
+    tokens_lote = 0
+    for i, texto in enumerate(textos):
+        tokens = min(estimar_tokens(texto), MAX_TOKENS_POR_TEXTO)
+        if lote and (len(lote) >= max_items or tokens_lote + tokens > max_tokens):
+            yield lote
+            lote = []
+            tokens_lote = 0
+        lote.append(i)
+        tokens_lote += tokens
+    if lote:
+        yield lote
+
+def _embeber_lote(textos: List[str], modelo: str) -> List[List[float]]:
+    """Embebe un lote consultando primero el cache; solo los textos faltantes van a la API."""
+    cache = obtener_cache()
+    embeddings = cache.obtener_muchos(textos, modelo)
+    faltantes = [i for i, e in enumerate(embeddings) if e is None]
+    if not faltantes:
+        return embeddings
+
+    response = obtener_cliente().embeddings.create(
+        input=[textos[i] for i in faltantes],
+        model=modelo
+    )
+    # La API no garantiza el orden de `data`; cada elemento trae su índice
+    for dato in response.data:
+        embeddings[faltantes[dato.index]] = dato.embedding
+    cache.guardar_muchos([textos[i] for i in faltantes], [embeddings[i] for i in faltantes], modelo)
+    return embeddings
+
+def generar_embeddings(textos: List[str], modelo: str = MODELO_EMBEDDING) -> List[List[float]]:
+    """Genera los embeddings de `textos` con la menor cantidad de llamadas posible, en orden."""
+    resultado = [None] * len(textos)
+    for indices in particionar_lotes(textos):
+        embeddings = _embeber_lote([textos[i] for i in indices], modelo)
+        for i, embedding in zip(indices, embeddings):
+            resultado[i] = embedding
+    return resultado
+
+def generar_embedding(texto: str, modelo: str = MODELO_EMBEDDING) -> List[float]:
+    return generar_embeddings([texto], modelo)[0]
+
+def tamanio_serializado(vector: Dict[str, Any]) -> int:
+    """Bytes que ocupa el vector en el cuerpo JSON del upsert."""
+    return len(json.dumps(vector, ensure_ascii=False).encode("utf-8"))
+
+def particionar_upserts(vectores: List[Dict[str, Any]], max_bytes: int = MAX_BYTES_UPSERT,
+                        max_vectores: int = MAX_VECTORES_UPSERT) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Agrupa los vectores en lotes que no pasan de `max_bytes` serializados ni de
+    `max_vectores`: con metadata larga entran menos vectores por lote, con corta más.
+    """
+    lote, bytes_lote = [], 0
+    for vector in vectores:
+        tamanio = tamanio_serializado(vector)
+        if lote and (bytes_lote + tamanio > max_bytes or len(lote) >= max_vectores):
+            yield lote
+            lote, bytes_lote = [], 0
+        lote.append(vector)
+        bytes_lote += tamanio
+    if lote:
+        yield lote
+
+
+class SubidorVectores:
+    """
+    Sube lotes de vectores por varias conexiones en paralelo. Como mucho hay
+    2 * hilos lotes en vuelo: `enviar` se bloquea si la subida va atrasada, así
+    la memoria no crece mientras se siguen generando embeddings. Cada lote que
+    falla se reintenta solo, con backoff; los que fallan todos sus intentos se
+    informan al cerrar, sin cortar la subida del resto.
+    """
+
+    def __init__(self, index, namespace: str, hilos: int = HILOS_UPSERT,
+                 max_bytes: int = MAX_BYTES_UPSERT, max_vectores: int = MAX_VECTORES_UPSERT,
+                 max_intentos: int = MAX_INTENTOS_UPSERT):
+        self.index = index
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        self.max_vectores = max_vectores
+        self.max_intentos = max_intentos
+        self.subidos = 0
+        self.fallidos: List[str] = []
+        self._lock = threading.Lock()
+        self._en_vuelo = threading.BoundedSemaphore(2 * hilos)
+        self._pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="upsert")
+        self._futuros = []
+        self._resto: List[Dict[str, Any]] = []
+
+    def _subir_lote(self, lote: List[Dict[str, Any]], bytes_lote: int):
+        try:
+            for intento in range(self.max_intentos):
+                try:
+                    self.index.upsert(vectors=lote, namespace=self.namespace)
+                    break
+                except Exception as e:
+                    if intento == self.max_intentos - 1:
+                        print(f"❌ Lote de {len(lote)} vectores descartado tras {self.max_intentos} intentos: {e}")
+                        with self._lock:
+                            self.fallidos.extend(str(v["id"]) for v in lote)
+                        return
+                    espera = ESPERA_BASE_UPSERT * 2 ** intento * random.uniform(0.5, 1.5)
+                    print(f"⚠️ Upsert falló ({e}), reintento {intento + 1} en {espera:.1f}s")
+                    time.sleep(espera)
+            with self._lock:
+                self.subidos += len(lote)
+            print(f"🔄 Insertados {len(lote)} vectores ({bytes_lote / 1024:.0f} KB) en namespace '{self.namespace}'")
+        finally:
+            self._en_vuelo.release()
+
+    def _enviar_lote(self, lote: List[Dict[str, Any]]):
+        self._en_vuelo.acquire()
+        bytes_lote = sum(tamanio_serializado(v) for v in lote)
+        self._futuros.append(self._pool.submit(self._subir_lote, lote, bytes_lote))
+
+    def enviar(self, vectores: List[Dict[str, Any]]):
+        # El último lote, incompleto, espera a los vectores de la próxima llamada
+        lotes = list(particionar_upserts(self._resto + vectores, self.max_bytes, self.max_vectores))
+        self._resto = lotes.pop() if lotes else []
+        for lote in lotes:
+            self._enviar_lote(lote)
+
+    def esperar(self):
+        if self._resto:
+            self._enviar_lote(self._resto)
+            self._resto = []
+        for futuro in self._futuros:
+            futuro.result()
+        self._pool.shutdown()
+
+    def cerrar(self) -> int:
+        """Espera a que terminen todas las subidas; falla si quedó algún lote sin subir."""
+        self.esperar()
+        if self.fallidos:
+            raise RuntimeError(f"No se pudieron subir {len(self.fallidos)} vectores: {self.fallidos[:10]}...")
+        return self.subidos
+
+def insertar_con_embeddings(items: List[Any],
+                            textos: List[str],
+                            construir_vector: Callable[[Any, List[float]], Dict[str, Any]],
+                            index,
+                            namespace: str,
+                            tamanio_upsert: int = MAX_VECTORES_UPSERT,
+                            modelo: str = MODELO_EMBEDDING) -> int:
+    """
+    Embebe `textos` por lotes y sube los vectores resultantes a `index`.
+    Los upserts corren en paralelo (SubidorVectores) mientras se embebe el
+    siguiente lote, agrupados por tamaño serializado; `tamanio_upsert` es
+    solo el tope de vectores por upsert.
+
+    construir_vector(item, embedding) debe devolver el dict {id, values, metadata}.
+    Devuelve la cantidad de vectores insertados.
+    """
+    total = len(textos)
+    procesados = 0
+    subidor = SubidorVectores(index, namespace, max_vectores=tamanio_upsert)
+    try:
+        for indices in particionar_lotes(textos):
+            embeddings = _embeber_lote([textos[i] for i in indices], modelo)
+            procesados += len(indices)
+            print(f"[{procesados}/{total}] Embeddings listos ({len(indices)} en el lote)")
+
+            subidor.enviar([construir_vector(items[i], emb) for i, emb in zip(indices, embeddings)])
+    except Exception:
+        # Que no queden hilos subiendo cuando el error llega al que llamó
+        subidor.esperar()
+        raise
+    subidos = subidor.cerrar()
+    if subidos:
+        publicar_version(index, namespace)
+    stats = obtener_cache().estadisticas()
+    print(f"📦 Cache de embeddings: {stats['hits']} hits, {stats['misses']} misses")
+    return subidos
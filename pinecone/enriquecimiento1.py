@@ -1,20 +1,34 @@
 import json
 import os
-import time
-import re
+import sys
+from collections import defaultdict
 from dotenv import load_dotenv
-from openai import OpenAI
+
+from motor_enriquecimiento import MotorEnriquecimiento, FormatoObjetos, FormatoCompacto
+from diario_enriquecimiento import DiarioEnriquecimiento, EscritorDiario
+from cache_enriquecimiento import obtener_cache_enriquecimiento, clave_nombre
 
 # Cargar variables de entorno
 load_dotenv()
-openai = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
 
 # === CONFIGURACIÓN ===
 INPUT_JSON = "pictogramas_adicionales.json"
 OUTPUT_JSON = "pictogramas_enriquecidos2.json"
-LOTE = 5  # cantidad de pictogramas por lote
-SLEEP_TIME = 2  # segundos entre llamadas
-LOG_FILE = "proceso_enriquecimiento.log"    
+DIARIO_JSONL = OUTPUT_JSON + ".diario.jsonl"  # checkpoints; se compacta en OUTPUT_JSON al terminar
+MAX_EN_VUELO = int(os.environ.get("ENRIQUECIMIENTO_EN_VUELO", 8))  # lotes enviados en paralelo
+RESPUESTA_COMPACTA = os.environ.get("ENRIQUECIMIENTO_COMPACTO", "0") == "1"  # respuestas como arrays posicionales en lugar de objetos
+LOG_FILE = "proceso_enriquecimiento.log"
+
+CAMPOS = [  # campos pedidos a la API, en orden, con su aclaración para el prompt
+    ("definicion", "mínimo 2 oraciones"),
+    ("categoria", "ej: postres, carnes, bebidas, etc."),
+    ("subcategoria", "ej: para carnes: vacuna, cerdo, etc."),
+    ("origen", "país o región de origen, si es relevante"),
+    ("tipo_de_coccion", "frito, horneado, a la parrilla, etc."),
+    ("ingredientes", "lista de ingredientes principales"),
+    ("forma_de_servir", "cómo se sirve típicamente"),
+    ("equivalentes", "otros nombres por los que se conoce"),
+]
 
 def setup_logging():
     """Configura el registro de actividad en archivo."""
@@ -32,92 +46,49 @@ def normalizar_nombre(nombre):
         nombre = nombre[0]  # Tomar el primer nombre si es una lista
     return nombre.split(",")[0].strip()
 
-def generar_etiquetas_lote(nombres: list, logger) -> list:
-    """Llama a OpenAI para enriquecer un lote de nombres de alimentos."""
+def construir_prompt(nombres: list) -> str:
+    """Arma el prompt para enriquecer un lote de nombres de alimentos."""
     lista = "\n".join([f"{i+1}. {n}" for i, n in enumerate(nombres)])
+    campos = "\n".join(f"- {campo}" + (f" ({descripcion})" if descripcion else "") for campo, descripcion in CAMPOS)
     
-    prompt = (
+    return (
         "Genera una descripción detallada y etiquetas para los siguientes alimentos. "
         "Responde en formato JSON como una lista, uno por cada alimento. Cada elemento debe tener los siguientes campos:\n"
         "- nombre\n"
-        "- definicion (mínimo 2 oraciones)\n"
-        "- categoria (ej: postres, carnes, bebidas, etc.)\n"
-        "- subcategoria (ej: para carnes: vacuna, cerdo, etc.)\n"
-        "- origen (país o región de origen, si es relevante)\n"
-        "- tipo_de_coccion (frito, horneado, a la parrilla, etc.)\n"
-        "- ingredientes (lista de ingredientes principales)\n"
-        "- forma_de_servir (cómo se sirve típicamente)\n"
-        "- equivalentes (otros nombres por los que se conoce)\n\n"
+        f"{campos}\n\n"
         f"Alimentos:\n{lista}"
     )
-    try:
-        logger.info(f"Enviando solicitud para lote: {nombres}")
-        response = openai.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=1500,  # Aumentado para respuestas más completas
-            temperature=0.7   # Reducido para mayor consistencia
-        )
-        contenido = response.choices[0].message.content.strip()
-        
-        # Eliminar bloque markdown ```json ... ```
-        if contenido.startswith("```"):
-            contenido = re.sub(r"^```(?:json)?\n", "", contenido)
-            contenido = re.sub(r"\n```$", "", contenido)
-        
-        # Guardar para debug
-        with open("debug_respuesta_lote.txt", "w", encoding="utf-8") as f:
-            f.write(contenido)
-        
-        resultados = json.loads(contenido)
-        logger.info(f"Lote procesado correctamente, {len(resultados)} elementos")
-        return resultados
-    except json.JSONDecodeError as e:
-        logger.error(f"Error decodificando JSON: {e}")
-        logger.error(f"Contenido problemático: {contenido}")
-        return []
-    except Exception as e:
-        logger.error(f"Error generando lote: {e}")
-        return []
 
-def enriquecer_en_lotes(pictogramas, logger):
-    """Procesa todos los pictogramas en lotes."""
+def enriquecer_en_lotes(pictogramas, logger, diario):
+    """
+    Procesa en lotes, con varias solicitudes en paralelo, los pictogramas que
+    todavía no están en el diario; cada pictograma enriquecido se agrega al diario.
+    """
     enriquecidos = pictogramas.copy()
-    total = len(enriquecidos)
-    logger.info(f"Iniciando enriquecimiento de {total} pictogramas")
-    print(f"📋 Pictogramas totales a enriquecer: {total}")
+    ya_enriquecidos = diario.reproducir()
+    pendientes = [p for p in enriquecidos if p.get("id del pictograma de ARASAAC") not in ya_enriquecidos]
+    total = len(pendientes)
+    logger.info(f"Iniciando enriquecimiento de {total} pictogramas ({len(ya_enriquecidos)} ya en el diario)")
+    print(f"📋 Pictogramas totales a enriquecer: {total} (reanudando con {len(ya_enriquecidos)} ya enriquecidos)")
     
-    for i in range(0, total, LOTE):
-        lote_actual = enriquecidos[i:i+LOTE]
-        nombres_lote = [normalizar_nombre(p["nombre del pictograma"]) for p in lote_actual]
-        print(f"\n🔄 Procesando lote {i//LOTE + 1}/{(total+LOTE-1)//LOTE}: {nombres_lote}")
-        
-        # Intentos máximos en caso de fallo
-        intentos = 0
-        max_intentos = 3
-        resultados = []
-        
-        while intentos < max_intentos and not resultados:
-            if intentos > 0:
-                logger.warning(f"Reintentando lote ({intentos}/{max_intentos})")
-                print(f"⚠️ Reintentando lote ({intentos}/{max_intentos})")
-                time.sleep(SLEEP_TIME * 2)  # Esperar más tiempo en reintentos
-                
-            resultados = generar_etiquetas_lote(nombres_lote, logger)
-            intentos += 1
-        
-        if not resultados:
-            logger.error(f"Lote omitido después de {max_intentos} intentos")
-            print("⚠️ Lote omitido por error en la respuesta después de varios intentos.")
-            continue
-        
-        for j, result in enumerate(resultados):
-            if j >= len(lote_actual):
-                logger.warning("Más resultados que entradas. Saltando extra.")
-                print("⚠️ Más resultados que entradas. Saltando extra.")
-                continue
-                
-            picto = lote_actual[j]
+    # Un solo pedido por plato: los ids con el mismo nombre normalizado comparten resultado
+    grupos = defaultdict(list)  # clave del plato -> posiciones en pendientes
+    for j, p in enumerate(pendientes):
+        grupos[clave_nombre(p["nombre del pictograma"])].append(j)
+    cache = obtener_cache_enriquecimiento()
+    cacheados = cache.obtener_muchos(list(grupos))
+    claves = [clave for clave in grupos if clave not in cacheados]
+    nombres = [normalizar_nombre(pendientes[grupos[clave][0]]["nombre del pictograma"]) for clave in claves]
+    print(f"🗃️ {len(grupos)} platos distintos: {len(cacheados)} ya enriquecidos en el cache, {len(claves)} a pedir")
+    completados = 0
+    escritor = EscritorDiario(diario, cache)
+    
+    def aplicar(posiciones, result, clave=None):
+        nonlocal completados
+        listos = []
+        for j in posiciones:
+            completados += 1
+            picto = pendientes[j]
             
             # Conservar campos originales
             id_original = picto.get("id del pictograma de ARASAAC")
@@ -131,25 +102,44 @@ def enriquecer_en_lotes(pictogramas, logger):
             # Restaurar campos originales
             picto["id del pictograma de ARASAAC"] = id_original
             picto["nombre del pictograma"] = nombres_originales
-            
-            # Guardar progreso parcial cada lote completado
-            if (i + LOTE >= total) or ((i + LOTE) % 20 == 0):
-                with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
-                    json.dump(enriquecidos, f, ensure_ascii=False, indent=2)
-                logger.info(f"Guardado progreso: {i + min(LOTE, total-i)}/{total} pictogramas")
-                
-        print(f"✅ Lote completado: {len(resultados)} pictogramas enriquecidos")
+            listos.append(picto)
         
-        # Esperar entre lotes para no sobrecargar la API
-        if i + LOTE < total:
-            time.sleep(SLEEP_TIME)
+        # Checkpoint: los pictogramas (y el plato nuevo, para el cache) van al hilo escritor
+        escritor.encolar(listos, clave, result)
+    
+    def al_recibir(k, result):
+        aplicar(grupos[claves[k]], result, claves[k])
+    
+    def al_completar(posiciones, faltantes):
+        print(f"\n🔄 Lote recibido: {[nombres[k] for k in posiciones]}")
+        logger.info(f"Guardado progreso: {completados}/{total} pictogramas")
+        
+        if faltantes:
+            print(f"⚠️ Sin respuesta válida, vuelven a la cola: {[nombres[k] for k in faltantes]}")
+                
+        print(f"✅ Lote completado: {len(posiciones) - len(faltantes)} platos enriquecidos ({completados}/{total} pictogramas)")
+    
+    try:
+        for clave, result in cacheados.items():
+            aplicar(grupos[clave], result)
+        formato = FormatoCompacto(CAMPOS) if RESPUESTA_COMPACTA else FormatoObjetos(construir_prompt)
+        motor = MotorEnriquecimiento(formato, logger, max_en_vuelo=MAX_EN_VUELO)
+        omitidos = motor.procesar(nombres, al_recibir, al_completar)
+    finally:
+        escritor.cerrar()
+    if omitidos:
+        print(f"⚠️ Omitidos por error en la respuesta después de varios intentos: {[nombres[k] for k in omitidos]}")
     
     return enriquecidos
 
 def main():
-    """Función principal"""
+    """
+    Función principal. Con `--compactar` solo se vuelca el diario en OUTPUT_JSON,
+    sin enriquecer nada.
+    """
     logger = setup_logging()
     logger.info("=== INICIO DEL PROCESO DE ENRIQUECIMIENTO ===")
+    diario = DiarioEnriquecimiento(DIARIO_JSONL)
     
     try:
         # Cargar pictogramas originales
@@ -158,11 +148,17 @@ def main():
             pictogramas = json.load(f)
         
         # Proceso de enriquecimiento
-        base_enriquecida = enriquecer_en_lotes(pictogramas, logger)
+        if "--compactar" not in sys.argv[1:]:
+            enriquecer_en_lotes(pictogramas, logger, diario)
+        elif not os.path.exists(DIARIO_JSONL):
+            # El diario se vacía al compactar: sin él, OUTPUT_JSON se pisaría con la entrada sin enriquecer
+            print(f"ℹ️ No hay diario pendiente; '{OUTPUT_JSON}' queda como está")
+            return
         
-        # Guardar resultado final
-        with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
-            json.dump(base_enriquecida, f, ensure_ascii=False, indent=2)
+        # Guardar resultado final: compactación atómica del diario
+        base_enriquecida = diario.compactar(OUTPUT_JSON, pictogramas)
+        # Todo quedó en OUTPUT_JSON: la próxima corrida arranca con el diario vacío
+        diario.vaciar()
         
         print(f"\n✅ Proceso completado. Archivo enriquecido guardado como '{OUTPUT_JSON}'")
         logger.info(f"Proceso completado. Se enriquecieron {len(base_enriquecida)} pictogramas")
@@ -1,21 +1,35 @@
 import json
 import os
-import time
-import re
+import sys
+from collections import defaultdict
 from dotenv import load_dotenv
-from openai import OpenAI
+
+from motor_enriquecimiento import MotorEnriquecimiento, FormatoObjetos, FormatoCompacto
+from diario_enriquecimiento import DiarioEnriquecimiento, EscritorDiario
+from cache_enriquecimiento import obtener_cache_enriquecimiento, clave_nombre
 
 # Cargar variables de entorno
 load_dotenv()
-openai = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
 
 # === CONFIGURACIÓN ===
 INPUT_JSON = "pictogramas_adicionales.json"
 OUTPUT_JSON = "pictogramas_enriquecidos2.json"
-LOTE = 5
-SLEEP_TIME = 2
+DIARIO_JSONL = OUTPUT_JSON + ".diario.jsonl"
+MAX_EN_VUELO = int(os.environ.get("ENRIQUECIMIENTO_EN_VUELO", 8))
+RESPUESTA_COMPACTA = os.environ.get("ENRIQUECIMIENTO_COMPACTO", "0") == "1"
 LOG_FILE = "proceso_enriquecimiento.log"
 
+CAMPOS = [
+    ("definicion", ""),
+    ("categoria", ""),
+    ("subcategoria", ""),
+    ("origen", ""),
+    ("tipo_de_coccion", ""),
+    ("ingredientes", "lista"),
+    ("forma_de_servir", ""),
+    ("equivalentes", "lista"),
+]
+
 def setup_logging():
     import logging
     logging.basicConfig(
@@ -30,82 +44,74 @@ def normalizar_nombre(nombre):
         nombre = nombre[0]
     return nombre.split(",")[0].strip()
 
-def generar_etiquetas_lote(nombres: list, logger) -> list:
+def construir_prompt(nombres: list) -> str:
     lista = "\n".join([f"{i+1}. {n}" for i, n in enumerate(nombres)])
+    campos = "\n".join(f"- {campo}" + (f" ({descripcion})" if descripcion else "") for campo, descripcion in CAMPOS)
     
-    prompt = (
+    return (
         "Genera una descripción detallada y etiquetas para los siguientes alimentos. "
         "Responde en formato JSON como una lista. Cada elemento debe tener los siguientes campos:\n"
         "- nombre\n"
-        "- definicion\n"
-        "- categoria\n"
-        "- subcategoria\n"
-        "- origen\n"
-        "- tipo_de_coccion\n"
-        "- ingredientes (lista)\n"
-        "- forma_de_servir\n"
-        "- equivalentes (lista)\n\n"
+        f"{campos}\n\n"
         f"Alimentos:\n{lista}"
     )
-    try:
-        logger.info(f"Solicitando enriquecimiento para: {nombres}")
-        response = openai.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=1500,
-            temperature=0.7
-        )
-        contenido = response.choices[0].message.content.strip()
-        if contenido.startswith("```"):
-            contenido = re.sub(r"^```(?:json)?\n", "", contenido)
-            contenido = re.sub(r"\n```$", "", contenido)
-        
-        with open("debug_respuesta_lote.txt", "w", encoding="utf-8") as f:
-            f.write(contenido)
-
-        return json.loads(contenido)
-    except Exception as e:
-        logger.error(f"Error generando lote: {e}")
-        return []
 
-def enriquecer_en_lotes(pictogramas, logger, existentes):
+def enriquecer_en_lotes(pictogramas, logger, existentes, diario):
     enriquecidos = existentes.copy()
-    ids_existentes = {p["id del pictograma de ARASAAC"] for p in existentes}
+    ids_existentes = {p["id del pictograma de ARASAAC"] for p in existentes} | set(diario.reproducir())
     nuevos = [p for p in pictogramas if p["id del pictograma de ARASAAC"] not in ids_existentes]
     
     print(f"📋 Pictogramas NUEVOS a enriquecer: {len(nuevos)}")
     
-    for i in range(0, len(nuevos), LOTE):
-        lote_actual = nuevos[i:i+LOTE]
-        nombres_lote = [normalizar_nombre(p["nombre del pictograma"]) for p in lote_actual]
-        print(f"\n🔄 Procesando lote {i//LOTE + 1}: {nombres_lote}")
-
-        resultados = generar_etiquetas_lote(nombres_lote, logger)
-
-        if not resultados:
-            print("⚠️ Lote omitido por error en la respuesta.")
-            continue
-
-        for j, result in enumerate(resultados):
-            if j >= len(lote_actual):
-                continue
-            picto = lote_actual[j]
+    grupos = defaultdict(list)  # clave del plato -> posiciones en nuevos
+    for j, p in enumerate(nuevos):
+        grupos[clave_nombre(p["nombre del pictograma"])].append(j)
+    cache = obtener_cache_enriquecimiento()
+    cache.sembrar(existentes)
+    cacheados = cache.obtener_muchos(list(grupos))
+    claves = [clave for clave in grupos if clave not in cacheados]
+    nombres = [normalizar_nombre(nuevos[grupos[clave][0]]["nombre del pictograma"]) for clave in claves]
+    print(f"🗃️ {len(grupos)} platos distintos, {len(cacheados)} tomados del cache")
+
+    escritor = EscritorDiario(diario, cache)
+
+    def aplicar(posiciones, result, clave=None):
+        listos = []
+        for j in posiciones:
+            picto = nuevos[j]
             for campo, valor in result.items():
                 if campo != "nombre":
                     picto[campo] = valor
             enriquecidos.append(picto)
-        
-        with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
-            json.dump(enriquecidos, f, ensure_ascii=False, indent=2)
-        
-        print(f"✅ Lote {i//LOTE + 1} enriquecido y guardado")
-        time.sleep(SLEEP_TIME)
+            listos.append(picto)
+        escritor.encolar(listos, clave, result)
+
+    def al_recibir(k, result):
+        aplicar(grupos[claves[k]], result, claves[k])
+
+    def al_completar(posiciones, faltantes):
+        print(f"\n🔄 Lote recibido: {[nombres[k] for k in posiciones]}")
+        if faltantes:
+            print(f"⚠️ Sin respuesta válida: {[nombres[k] for k in faltantes]}")
+        print(f"✅ {len(posiciones) - len(faltantes)} enriquecidos y guardados")
+
+    try:
+        for clave, result in cacheados.items():
+            aplicar(grupos[clave], result)
+        formato = FormatoCompacto(CAMPOS) if RESPUESTA_COMPACTA else FormatoObjetos(construir_prompt)
+        motor = MotorEnriquecimiento(formato, logger, max_en_vuelo=MAX_EN_VUELO)
+        omitidos = motor.procesar(nombres, al_recibir, al_completar)
+    finally:
+        escritor.cerrar()
+    if omitidos:
+        print(f"⚠️ Omitidos por error en la respuesta: {[nombres[k] for k in omitidos]}")
 
     return enriquecidos
 
 def main():
     logger = setup_logging()
     logger.info("=== INICIO DEL PROCESO DE ENRIQUECIMIENTO ===")
+    diario = DiarioEnriquecimiento(DIARIO_JSONL)
     
     try:
         print(f"🔍 Cargando archivo de entrada: {INPUT_JSON}")
@@ -118,10 +124,11 @@ def main():
         else:
             existentes = []
 
-        base_final = enriquecer_en_lotes(nuevos_pictogramas, logger, existentes)
+        if "--compactar" not in sys.argv[1:]:
+            enriquecer_en_lotes(nuevos_pictogramas, logger, existentes, diario)
 
-        with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
-            json.dump(base_final, f, ensure_ascii=False, indent=2)
+        base_final = diario.compactar(OUTPUT_JSON, existentes)
+        diario.vaciar()
 
         print(f"\n✅ Archivo actualizado: {OUTPUT_JSON}")
         logger.info(f"Archivo enriquecido actualizado: {len(base_final)} pictogramas")
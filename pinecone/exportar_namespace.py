@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterator
+
+import numpy as np
+from pinecone import Pinecone
+from dotenv import load_dotenv
+
+from indice_local import guardar_bundle
+
+load_dotenv()
+
+PINECONE_API_KEY = os.environ.get("PINECONE_API_KEY")
+INDEX_NAME = "rufusmenu"
+TAMANIO_PAGINA = 100  # ids por página de list/fetch
+HILOS_FETCH = 8
+
+def listar_ids(index, namespace: str, tamanio_pagina: int = TAMANIO_PAGINA) -> Iterator[List[str]]:
+    """Recorre el namespace página por página (solo índices serverless)."""
+    token = None
+    while True:
+        respuesta = index.list_paginated(namespace=namespace, limit=tamanio_pagina, pagination_token=token)
+        ids = [v.id for v in respuesta.vectors]
+        if ids:
+            yield ids
+        token = respuesta.pagination.next if respuesta.pagination else None
+        if not token:
+            break
+
+def fetch_pagina(index, ids: List[str], namespace: str) -> List[Dict[str, Any]]:
+    respuesta = index.fetch(ids=ids, namespace=namespace)
+    vectores = []
+    for id_vector in ids:
+        v = respuesta.vectors.get(id_vector)
+        if v is None:
+            # Borrado entre el list y el fetch
+            continue
+        vectores.append({"id": id_vector, "values": v.values, "metadata": dict(v.metadata or {})})
+    return vectores
+
+def exportar_namespace(index, namespace: str, ruta_salida: str,
+                       origen: str = INDEX_NAME, hilos: int = HILOS_FETCH) -> Dict[str, Any]:
+    """
+    Descarga todos los vectores y metadatos de `namespace` y los guarda como bundle
+    local (ver indice_local.guardar_bundle). Las páginas se piden en paralelo a
+    medida que el listado las va entregando.
+    """
+    inicio = time.time()
+    print(f"📥 Exportando namespace '{namespace}' a {ruta_salida}...")
+
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        futuros = [pool.submit(fetch_pagina, index, ids, namespace) for ids in listar_ids(index, namespace)]
+        ids, valores, metadata = [], [], []
+        for i, futuro in enumerate(futuros):
+            for v in futuro.result():
+                ids.append(v["id"])
+                valores.append(v["values"])
+                metadata.append(v["metadata"])
+            print(f"    Página {i+1}/{len(futuros)}: {len(ids)} vectores")
+
+    if not ids:
+        print(f"⚠️ Namespace '{namespace}' vacío, no se escribió nada.")
+        return {}
+
+    matriz = np.asarray(valores, dtype=np.float32)
+    manifiesto = guardar_bundle(ruta_salida, namespace, ids, matriz, metadata, origen=origen)
+    print(f"✅ {len(ids)} vectores exportados en {time.time() - inicio:.1f} segundos (versión {manifiesto['version']})")
+    return manifiesto
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("❌ Uso: python exportar_namespace.py <NAMESPACE> <DIRECTORIO_SALIDA> [INDICE]")
+    else:
+        nombre_indice = sys.argv[3] if len(sys.argv) > 3 else INDEX_NAME
+        pc = Pinecone(api_key=PINECONE_API_KEY)
+        exportar_namespace(pc.Index(nombre_indice), sys.argv[1], sys.argv[2], origen=nombre_indice)
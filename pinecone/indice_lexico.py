@@ -0,0 +1,157 @@
+import json
+import os
+import re
+import unicodedata
+from collections import defaultdict
+from typing import List, Dict, Any, Iterable, Optional
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+FUENTES_LEXICAS = [
+    os.path.join(DIRECTORIO, "DEFINITIVO.json"),
+    os.path.join(DIRECTORIO, "ARASAAC-argentino.json"),
+    os.path.join(DIRECTORIO, "pictogramas_enriquecidos.json"),
+]
+RUTA_INDICE_LEXICO = os.path.join(DIRECTORIO, ".indice_lexico.json")
+
+# Campos con nombres de pictograma, en orden de prioridad (el nombre canónico gana sobre los equivalentes)
+CAMPOS_NOMBRE = [
+    "nombre del pictograma de ARASAAC",
+    "nombre del pictograma",
+    "nombre",
+    "traduccion al argentino del nombre del pictograma de ARASAAC",
+    "equivalentes",
+]
+PALABRAS_VACIAS = {"de", "del", "con", "al", "a", "la", "el", "los", "las", "y", "en", "e", "o", "u"}
+SCORE_EXACTO = 1.0
+SCORE_APROXIMADO = 0.95
+
+def plegar(texto: str) -> str:
+    """Minúsculas, sin tildes ni signos: 'Sánguche de Miga!' -> 'sanguche de miga'."""
+    texto = unicodedata.normalize("NFKD", texto)
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    return " ".join(re.findall(r"[a-z0-9]+", texto))
+
+def raiz(palabra: str) -> str:
+    # Plural y vocal final fuera, aplicado igual de ambos lados: tomates/tomate -> tomat, flanes/flan -> flan
+    if len(palabra) > 3 and palabra.endswith("s"):
+        palabra = palabra[:-1]
+    if len(palabra) > 3 and palabra.endswith("e") and palabra[-2] not in "aeiou":
+        palabra = palabra[:-1]
+    return palabra
+
+def clave_aproximada(texto: str) -> str:
+    """Forma casi exacta: plegada, sin palabras vacías, números ni plurales."""
+    palabras = [p for p in plegar(texto).split() if p not in PALABRAS_VACIAS and not p.isdigit()]
+    return " ".join(raiz(p) for p in palabras)
+
+def extraer_nombres(valor: Any) -> List[str]:
+    """Separa listas y cadenas con comas ('caramelo, gomita') y quita aclaraciones entre paréntesis."""
+    if valor is None:
+        return []
+    valores = valor if isinstance(valor, list) else [valor]
+    nombres = []
+    for v in valores:
+        if not isinstance(v, str):
+            continue
+        v = re.sub(r"\(.*?\)", "", v)
+        nombres.extend(n.strip() for n in v.split(",") if n.strip())
+    return nombres
+
+
+class IndiceLexico:
+    """
+    Índice invertido de nombres de pictogramas (canónicos, traducciones
+    rioplatenses y equivalentes) con plegado de tildes y mayúsculas.
+    Resuelve sin OpenAI ni Pinecone las consultas que coinciden exactamente
+    o casi exactamente con un nombre conocido.
+    """
+
+    def __init__(self):
+        self.exactas: Dict[str, List[int]] = {}
+        self.aproximadas: Dict[str, List[int]] = {}
+        self.nombres: Dict[int, str] = {}
+
+    @classmethod
+    def construir(cls, registros: Iterable[Dict[str, Any]]) -> "IndiceLexico":
+        indice = cls()
+        exactas = defaultdict(list)
+        aproximadas = defaultdict(list)
+        for registro in registros:
+            id_picto = registro.get("id del pictograma de ARASAAC")
+            if id_picto is None:
+                continue
+            id_picto = int(id_picto)
+            for campo in CAMPOS_NOMBRE:
+                for nombre in extraer_nombres(registro.get(campo)):
+                    indice.nombres.setdefault(id_picto, nombre)
+                    for tabla, clave in ((exactas, plegar(nombre)), (aproximadas, clave_aproximada(nombre))):
+                        if clave and id_picto not in tabla[clave]:
+                            tabla[clave].append(id_picto)
+        indice.exactas = dict(exactas)
+        indice.aproximadas = dict(aproximadas)
+        return indice
+
+    def buscar(self, consulta: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        """Devuelve pictogramas con el mismo formato que la búsqueda semántica, o [] si no hay coincidencia."""
+        ids = self.exactas.get(plegar(consulta))
+        score = SCORE_EXACTO
+        if not ids:
+            ids = self.aproximadas.get(clave_aproximada(consulta))
+            score = SCORE_APROXIMADO
+        if not ids:
+            return []
+        return [
+            {
+                "id del pictograma de ARASAAC": id_picto,
+                "score": score,
+                "nombre del pictograma": self.nombres.get(id_picto, ""),
+            }
+            for id_picto in ids[:top_k]
+        ]
+
+    def guardar(self, ruta: str):
+        datos = {
+            "exactas": self.exactas,
+            "aproximadas": self.aproximadas,
+            "nombres": {str(k): v for k, v in self.nombres.items()},
+        }
+        with open(ruta + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(datos, f, ensure_ascii=False)
+        os.replace(ruta + ".tmp", ruta)
+
+    @classmethod
+    def cargar(cls, ruta: str) -> "IndiceLexico":
+        with open(ruta, "r", encoding="utf-8") as f:
+            datos = json.load(f)
+        indice = cls()
+        indice.exactas = datos["exactas"]
+        indice.aproximadas = datos["aproximadas"]
+        indice.nombres = {int(k): v for k, v in datos["nombres"].items()}
+        return indice
+
+
+def leer_registros(rutas: List[str]) -> Iterable[Dict[str, Any]]:
+    for ruta in rutas:
+        if not os.path.exists(ruta):
+            continue
+        with open(ruta, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+
+def desactualizado(ruta_indice: str, fuentes: List[str]) -> bool:
+    if not os.path.exists(ruta_indice):
+        return True
+    modificado = os.path.getmtime(ruta_indice)
+    return any(os.path.exists(f) and os.path.getmtime(f) > modificado for f in fuentes)
+
+_indice: Optional[IndiceLexico] = None
+
+def obtener_indice_lexico(fuentes: List[str] = FUENTES_LEXICAS, ruta: str = RUTA_INDICE_LEXICO) -> IndiceLexico:
+    """Carga el índice precompilado; lo reconstruye solo si algún JSON fuente es más nuevo."""
+    global _indice
+    if _indice is None:
+        if desactualizado(ruta, fuentes):
+            _indice = IndiceLexico.construir(leer_registros(fuentes))
+            _indice.guardar(ruta)
+        else:
+            _indice = IndiceLexico.cargar(ruta)
+    return _indice
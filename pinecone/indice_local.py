@@ -0,0 +1,357 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import List, Dict, Any, Tuple
+
+import numpy as np
+
+FORMATO_BUNDLE = 1
+ARCHIVO_MANIFIESTO = "manifiesto.json"
+ARCHIVO_VECTORES = "vectores.f32"
+ARCHIVO_METADATA = "ids_metadata.jsonl"
+ARCHIVO_ACTUAL = "CURRENT"  # nombre del subdirectorio con la exportación vigente
+PREFIJO_EXPORTACION = "exportacion-"
+EXPORTACIONES_CONSERVADAS = 2  # la vigente y la anterior
+
+
+class Coincidencia(dict):
+    """Resultado de búsqueda accesible como dict (match["id"]) o como atributo (match.id), igual que en Pinecone."""
+
+    def __getattr__(self, nombre):
+        try:
+            return self[nombre]
+        except KeyError:
+            raise AttributeError(nombre)
+
+
+class _Namespace:
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self.ids: List[str] = []
+        self.posiciones: Dict[str, int] = {}
+        self.metadata: List[Dict[str, Any]] = []
+        self.matriz = np.empty((0, dimension), dtype=np.float32)
+        self._pendientes: List[np.ndarray] = []
+        self.version = None
+
+    def upsert(self, id_vector: str, valores: np.ndarray, metadata: Dict[str, Any]):
+        self.version = None
+        pos = self.posiciones.get(id_vector)
+        if pos is None:
+            self.posiciones[id_vector] = len(self.ids)
+            self.ids.append(id_vector)
+            self.metadata.append(metadata)
+            self._pendientes.append(valores)
+        else:
+            self._consolidar()
+            if not self.matriz.flags.writeable:
+                # Matriz mapeada desde un bundle: se copia a memoria antes de modificarla
+                self.matriz = np.array(self.matriz)
+            self.matriz[pos] = valores
+            self.metadata[pos] = metadata
+
+    def actualizar_metadata(self, id_vector: str, metadata: Dict[str, Any]) -> bool:
+        pos = self.posiciones.get(id_vector)
+        if pos is None:
+            return False
+        self.version = None
+        self.metadata[pos] = {**self.metadata[pos], **metadata}
+        return True
+
+    def borrar(self, ids: List[str]):
+        borrar = {self.posiciones[i] for i in ids if i in self.posiciones}
+        if not borrar:
+            return
+        self.version = None
+        self._consolidar()
+        conservar = [pos for pos in range(len(self.ids)) if pos not in borrar]
+        self.matriz = self.matriz[conservar]  # indexar con una lista copia, también si era un memmap
+        self.ids = [self.ids[pos] for pos in conservar]
+        self.metadata = [self.metadata[pos] for pos in conservar]
+        self.posiciones = {id_vector: i for i, id_vector in enumerate(self.ids)}
+
+    def _consolidar(self):
+        # Los vectores nuevos se acumulan y se apilan una sola vez antes de consultar
+        if self._pendientes:
+            self.matriz = np.vstack([self.matriz, np.stack(self._pendientes)])
+            self._pendientes = []
+
+    def obtener_matriz(self) -> np.ndarray:
+        self._consolidar()
+        return self.matriz
+
+
+def version_contenido(ids: List[str], matriz: np.ndarray, metadata: List[Dict[str, Any]]) -> str:
+    """Hash del contenido de un namespace; cambia si cambia cualquier id, vector o metadato."""
+    h = hashlib.sha256()
+    for id_vector, meta in zip(ids, metadata):
+        h.update(id_vector.encode("utf-8"))
+        h.update(json.dumps(meta, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    h.update(np.ascontiguousarray(matriz, dtype=np.float32).tobytes())
+    return h.hexdigest()[:16]
+
+def _escribir(ruta: str, datos: bytes) -> Dict[str, Any]:
+    """Escribe y sincroniza el archivo; devuelve su tamaño y hash para el manifiesto."""
+    with open(ruta, "wb") as f:
+        f.write(datos)
+        f.flush()
+        os.fsync(f.fileno())
+    return {"bytes": len(datos), "sha256": hashlib.sha256(datos).hexdigest()}
+
+def _directorio_actual(ruta: str) -> str:
+    """Directorio de la exportación vigente; los bundles sin CURRENT son del formato plano anterior."""
+    puntero = os.path.join(ruta, ARCHIVO_ACTUAL)
+    if not os.path.exists(puntero):
+        return ruta
+    with open(puntero, "r", encoding="utf-8") as f:
+        return os.path.join(ruta, f.read().strip())
+
+def _podar_exportaciones(ruta: str, actual: str, conservar: int = EXPORTACIONES_CONSERVADAS):
+    # Se conservan las últimas: un lector pudo leer CURRENT justo antes del cambio
+    anteriores = sorted(
+        (d for d in os.listdir(ruta) if d.startswith(PREFIJO_EXPORTACION) and d != actual),
+        key=lambda d: os.path.getmtime(os.path.join(ruta, d)), reverse=True
+    )
+    for directorio in anteriores[conservar - 1:]:
+        shutil.rmtree(os.path.join(ruta, directorio), ignore_errors=True)
+
+def guardar_bundle(ruta: str, namespace: str, ids: List[str], matriz: np.ndarray,
+                   metadata: List[Dict[str, Any]], origen: str = "") -> Dict[str, Any]:
+    """
+    Escribe un namespace como bundle en disco. Cada exportación va a un
+    subdirectorio nuevo con:
+      - vectores.f32: matriz float32 normalizada (filas x dimensión), legible con np.memmap
+      - ids_metadata.jsonl: una línea {id, metadata} por fila, en el mismo orden
+      - manifiesto.json: formato, dimensión, cantidad, versión de contenido y
+        tamaño y sha256 de los dos archivos anteriores
+    Recién con todo en disco se reemplaza el archivo CURRENT (os.replace) para
+    que apunte al subdirectorio nuevo: un lector ve la exportación anterior
+    completa o la nueva completa, nunca una mezcla.
+    """
+    os.makedirs(ruta, exist_ok=True)
+    matriz = normalizar(matriz) if len(ids) else np.empty((0, matriz.shape[-1]), dtype=np.float32)
+    version = version_contenido(ids, matriz, metadata)
+    nombre = f"{PREFIJO_EXPORTACION}{time.strftime('%Y%m%dT%H%M%S')}-{version}-{uuid.uuid4().hex[:6]}"
+    directorio = os.path.join(ruta, nombre)
+    os.makedirs(directorio)
+
+    archivos = {
+        ARCHIVO_VECTORES: _escribir(os.path.join(directorio, ARCHIVO_VECTORES),
+                                    np.ascontiguousarray(matriz).tobytes()),
+        ARCHIVO_METADATA: _escribir(os.path.join(directorio, ARCHIVO_METADATA), "".join(
+            json.dumps({"id": id_vector, "metadata": meta}, ensure_ascii=False) + "\n"
+            for id_vector, meta in zip(ids, metadata)
+        ).encode("utf-8")),
+    }
+    manifiesto = {
+        "formato": FORMATO_BUNDLE,
+        "namespace": namespace,
+        "origen": origen,
+        "dimension": int(matriz.shape[1]),
+        "cantidad": len(ids),
+        "dtype": "float32",
+        "normalizado": True,
+        "version": version,
+        "archivos": archivos,
+        "exportado": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    _escribir(os.path.join(directorio, ARCHIVO_MANIFIESTO),
+              json.dumps(manifiesto, ensure_ascii=False, indent=2).encode("utf-8"))
+
+    puntero = os.path.join(ruta, ARCHIVO_ACTUAL)
+    _escribir(puntero + ".tmp", nombre.encode("utf-8"))
+    os.replace(puntero + ".tmp", puntero)
+    _podar_exportaciones(ruta, nombre)
+    return manifiesto
+
+def _verificar_archivo(ruta: str, esperado: Dict[str, Any], verificar_hash: bool):
+    tamanio = os.path.getsize(ruta)
+    if tamanio != esperado["bytes"]:
+        raise ValueError(f"{ruta} mide {tamanio} bytes y el manifiesto dice {esperado['bytes']}")
+    if verificar_hash:
+        h = hashlib.sha256()
+        with open(ruta, "rb") as f:
+            for bloque in iter(lambda: f.read(1 << 20), b""):
+                h.update(bloque)
+        if h.hexdigest() != esperado["sha256"]:
+            raise ValueError(f"{ruta} no coincide con el sha256 del manifiesto")
+
+def leer_bundle(ruta: str, verificar_hash: bool = True) -> Tuple[Dict[str, Any], List[str], np.ndarray, List[Dict[str, Any]]]:
+    """
+    Lee la exportación vigente de un bundle mapeando la matriz con np.memmap
+    (solo lectura): los procesos que abren el mismo archivo comparten la copia
+    del page cache. Antes de mapear se comprueba que los archivos sean los del
+    manifiesto (tamaño y, si `verificar_hash`, sha256).
+    """
+    directorio = _directorio_actual(ruta)
+    with open(os.path.join(directorio, ARCHIVO_MANIFIESTO), "r", encoding="utf-8") as f:
+        manifiesto = json.load(f)
+    if manifiesto.get("formato") != FORMATO_BUNDLE:
+        raise ValueError(f"Formato de bundle no soportado: {manifiesto.get('formato')}")
+
+    ruta_vectores = os.path.join(directorio, ARCHIVO_VECTORES)
+    ruta_metadata = os.path.join(directorio, ARCHIVO_METADATA)
+    forma = (manifiesto["cantidad"], manifiesto["dimension"])
+    for nombre, esperado in manifiesto.get("archivos", {}).items():
+        _verificar_archivo(os.path.join(directorio, nombre), esperado, verificar_hash)
+    bytes_esperados = forma[0] * forma[1] * np.dtype(np.float32).itemsize
+    if os.path.getsize(ruta_vectores) != bytes_esperados:
+        raise ValueError(f"{ruta_vectores} no mide {bytes_esperados} bytes ({forma[0]} x {forma[1]} float32)")
+
+    ids, metadata = [], []
+    with open(ruta_metadata, "r", encoding="utf-8") as f:
+        for linea in f:
+            fila = json.loads(linea)
+            ids.append(fila["id"])
+            metadata.append(fila["metadata"])
+
+    if manifiesto["cantidad"]:
+        matriz = np.memmap(ruta_vectores, dtype=np.float32, mode="r", shape=forma)
+    else:
+        matriz = np.empty(forma, dtype=np.float32)
+    if len(ids) != forma[0]:
+        raise ValueError(f"El bundle {ruta} tiene {len(ids)} ids para {forma[0]} vectores")
+    return manifiesto, ids, matriz, metadata
+
+def normalizar(vectores: np.ndarray) -> np.ndarray:
+    """Normaliza filas a norma 1 para que el producto punto sea la similitud coseno."""
+    vectores = np.asarray(vectores, dtype=np.float32)
+    normas = np.linalg.norm(vectores, axis=-1, keepdims=True)
+    return vectores / np.maximum(normas, 1e-12)
+
+
+class IndiceLocal:
+    """
+    Índice vectorial en memoria con la misma interfaz que `pc.Index` para
+    upsert/update/delete/query/describe_index_stats. Guarda una matriz float32 normalizada
+    por namespace y resuelve cada consulta con un producto matricial y
+    argpartition (coseno exacto, fuerza bruta).
+
+    Pensado para el corpus de pictogramas (< 2000 vectores de 1536 dimensiones,
+    unos 12 MB), donde una consulta tarda microsegundos en vez de un viaje de red.
+    """
+
+    def __init__(self, dimension: int = 1536):
+        self.dimension = dimension
+        self._namespaces: Dict[str, _Namespace] = {}
+        self._lock = threading.Lock()  # los upserts pueden llegar desde varios hilos
+
+    def _namespace(self, namespace: str) -> _Namespace:
+        if namespace not in self._namespaces:
+            self._namespaces[namespace] = _Namespace(self.dimension)
+        return self._namespaces[namespace]
+
+    def upsert(self, vectors: List[Dict[str, Any]], namespace: str = "") -> Dict[str, int]:
+        with self._lock:
+            ns = self._namespace(namespace)
+            for v in vectors:
+                valores = normalizar(v["values"])
+                if valores.shape != (self.dimension,):
+                    raise ValueError(f"Dimensión {valores.shape} no coincide con {self.dimension}")
+                ns.upsert(str(v["id"]), valores, dict(v.get("metadata") or {}))
+        return {"upserted_count": len(vectors)}
+
+    def update(self, id: str, set_metadata: Dict[str, Any] = None, namespace: str = "", **_) -> Dict[str, Any]:
+        """Como en Pinecone, `set_metadata` se combina con la metadata existente."""
+        with self._lock:
+            ns = self._namespaces.get(namespace)
+            if ns is not None and set_metadata:
+                ns.actualizar_metadata(str(id), set_metadata)
+        return {}
+
+    def delete(self, ids: List[str] = None, namespace: str = "", delete_all: bool = False, **_) -> Dict[str, Any]:
+        with self._lock:
+            ns = self._namespaces.get(namespace)
+            if ns is not None:
+                ns.borrar(list(ns.ids) if delete_all else [str(i) for i in ids or []])
+        return {}
+
+    def _coincidencias(self, ns: _Namespace, scores: np.ndarray, top_k: int,
+                       include_metadata: bool, include_values: bool) -> List[Coincidencia]:
+        k = min(top_k, len(scores))
+        if k <= 0:
+            return []
+        if k < len(scores):
+            mejores = np.argpartition(-scores, k - 1)[:k]
+        else:
+            mejores = np.arange(len(scores))
+        mejores = mejores[np.argsort(-scores[mejores], kind="stable")]
+
+        matches = []
+        for pos in mejores:
+            match = Coincidencia(id=ns.ids[pos], score=float(scores[pos]))
+            if include_metadata:
+                match["metadata"] = ns.metadata[pos]
+            if include_values:
+                match["values"] = ns.matriz[pos].tolist()
+            matches.append(match)
+        return matches
+
+    def query(self, vector: List[float], top_k: int = 10, namespace: str = "",
+              include_metadata: bool = False, include_values: bool = False, **_) -> Dict[str, Any]:
+        ns = self._namespaces.get(namespace)
+        if ns is None:
+            return {"matches": [], "namespace": namespace}
+        matriz = ns.obtener_matriz()
+        consulta = normalizar(vector)
+        scores = matriz @ consulta
+        return {
+            "matches": self._coincidencias(ns, scores, top_k, include_metadata, include_values),
+            "namespace": namespace
+        }
+
+    def query_lote(self, vectores: List[List[float]], top_k: int = 10, namespace: str = "",
+                   include_metadata: bool = False, include_values: bool = False) -> List[Dict[str, Any]]:
+        """Resuelve varias consultas con un único producto matricial; devuelve una respuesta por vector, en orden."""
+        ns = self._namespaces.get(namespace)
+        if ns is None or not len(vectores):
+            return [{"matches": [], "namespace": namespace} for _ in vectores]
+        scores = normalizar(vectores) @ ns.obtener_matriz().T
+        return [
+            {
+                "matches": self._coincidencias(ns, fila, top_k, include_metadata, include_values),
+                "namespace": namespace
+            }
+            for fila in scores
+        ]
+
+    def describe_index_stats(self) -> Dict[str, Any]:
+        namespaces = {nombre: {"vector_count": len(ns.ids)} for nombre, ns in self._namespaces.items()}
+        return {
+            "dimension": self.dimension,
+            "total_vector_count": sum(n["vector_count"] for n in namespaces.values()),
+            "namespaces": namespaces
+        }
+
+    def cargar_bundle(self, ruta: str, namespace: str = None) -> Dict[str, Any]:
+        """Monta un bundle exportado como namespace sin copiar la matriz a memoria."""
+        manifiesto, ids, matriz, metadata = leer_bundle(ruta)
+        if manifiesto["dimension"] != self.dimension:
+            raise ValueError(f"El bundle tiene dimensión {manifiesto['dimension']}, se esperaba {self.dimension}")
+        ns = _Namespace(self.dimension)
+        ns.ids = ids
+        ns.posiciones = {id_vector: i for i, id_vector in enumerate(ids)}
+        ns.metadata = metadata
+        ns.matriz = matriz
+        ns.version = manifiesto["version"]
+        self._namespaces[namespace or manifiesto["namespace"]] = ns
+        return manifiesto
+
+    def guardar_bundle(self, ruta: str, namespace: str = "") -> Dict[str, Any]:
+        ns = self._namespace(namespace)
+        return guardar_bundle(ruta, namespace, ns.ids, ns.obtener_matriz(), ns.metadata, origen="local")
+
+    def version(self, namespace: str = "") -> str:
+        """Versión de contenido del namespace; se recalcula solo después de un upsert."""
+        ns = self._namespace(namespace)
+        if ns.version is None:
+            ns.version = version_contenido(ns.ids, ns.obtener_matriz(), ns.metadata)
+        return ns.version
+
+    def ids(self, namespace: str = "") -> List[str]:
+        ns = self._namespaces.get(namespace)
+        return list(ns.ids) if ns else []
@@ -1,13 +1,12 @@
 import json
 import os
-from openai import OpenAI
 from typing import List, Dict, Any
 import time
 from pinecone import Pinecone
+from embeddings import generar_embedding as _generar_embedding
 
 # Configuración de credenciales (recomendado usar variables de entorno)
 PINECONE_API_KEY = os.environ.get("PINECONE_API")
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 
 # Usar el índice existente
 INDEX_NAME = "rufusmenu"
@@ -18,7 +17,6 @@ ARCHIVO_JSON = "items_claude_sin_nombres.json"
 
 # Inicializar clientes con la nueva API de Pinecone
 pc = Pinecone(api_key=PINECONE_API_KEY)
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
 
 def conectar_a_indice():
     """Conecta al índice existente en Pinecone."""
@@ -44,11 +42,7 @@ def conectar_a_indice():
 
 def generar_embedding(texto: str) -> List[float]:
     """Genera un embedding usando el modelo de OpenAI."""
-    response = openai_client.embeddings.create(
-        input=texto,
-        model="text-embedding-3-small"
-    )
-    return response.data[0].embedding
+    return _generar_embedding(texto, modelo="text-embedding-3-small")
 
 def preparar_texto_para_embedding(pictograma: Dict[str, Any]) -> str:
     """
@@ -1,29 +1,65 @@
+import copy
 import json
 import os
-from openai import OpenAI
 from typing import List, Dict, Any
 import time
 from pinecone import Pinecone
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from embeddings import generar_embedding, generar_embeddings, insertar_con_embeddings
+from indice_local import IndiceLocal
+from cache_busquedas import CacheBusquedas, normalizar_consulta
+from registro_indices import RegistroIndices
+from indice_lexico import obtener_indice_lexico
+from bm25 import fusionar_resultados
+from correccion import obtener_corrector
+from sincronizacion import sincronizar, ruta_estado
 
 load_dotenv()
 
 PINECONE_API_KEY = os.environ.get("PINECONE_API")
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 NAMESPACE = "pictogramas_ada_enriquecidos2"
 INDEX_NAME = "rufusmenu"
 DIMENSION = 1536
+# Si está definido, las búsquedas usan un índice en memoria armado desde este JSON en lugar de Pinecone
+INDICE_LOCAL_JSON = os.environ.get("INDICE_LOCAL_JSON")
+# Alternativa: montar un bundle exportado con exportar_namespace.py (sin descargar ni embeber nada)
+INDICE_LOCAL_BUNDLE = os.environ.get("INDICE_LOCAL_BUNDLE")
+# Por debajo de este score (coseno de ada-002) la mejor coincidencia no se considera confiable
+UMBRAL_CONFIANZA = 0.80
+# Búsqueda híbrida: los resultados vectoriales se fusionan con BM25 (ver bm25.py)
+BUSQUEDA_HIBRIDA = os.environ.get("BUSQUEDA_HIBRIDA", "1") == "1"
+CANDIDATOS_FUSION = 20
+HILOS_CONSULTA = 8  # búsquedas concurrentes contra Pinecone en buscar_pictogramas_lote
 
-pc = Pinecone(api_key=PINECONE_API_KEY)
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+_pc = None
+_cache_busquedas = None
+
+def obtener_pinecone() -> Pinecone:
+    """Crea el cliente de Pinecone la primera vez que se necesita, no al importar el módulo."""
+    global _pc
+    if _pc is None:
+        _pc = Pinecone(api_key=PINECONE_API_KEY)
+    return _pc
+
+# Handles y estadísticas compartidos por todo el proceso (ver registro_indices.py)
+registro = RegistroIndices(lambda nombre: obtener_pinecone().Index(nombre))
+
+def obtener_cache_busquedas() -> CacheBusquedas:
+    global _cache_busquedas
+    if _cache_busquedas is None:
+        _cache_busquedas = CacheBusquedas()
+    return _cache_busquedas
 
 def conectar_a_indice(nombre_indice=None):
     if nombre_indice is None:
         nombre_indice = INDEX_NAME
     try:
         print(f"📋 Conectando al índice existente {nombre_indice}...")
-        index = pc.Index(nombre_indice)
-        stats = index.describe_index_stats()
+        index = registro.indice(nombre_indice)
+        stats = registro.estadisticas(nombre_indice)
+        if stats is None:
+            raise RuntimeError(f"El índice {nombre_indice} no respondió a describe_index_stats")
         print(f"✅ Conexión exitosa al índice {nombre_indice}")
         print(f"📊 Estadísticas actuales del índice:")
         print(f"    Total de vectores en el índice: {stats['total_vector_count']}")
@@ -36,13 +72,6 @@ def conectar_a_indice(nombre_indice=None):
         print(f"❌ Error al conectar con el índice: {str(e)}")
         raise
 
-def generar_embedding(texto: str) -> List[float]:
-    response = openai_client.embeddings.create(
-        input=texto,
-        model="text-embedding-ada-002"
-    )
-    return response.data[0].embedding
-
 def construir_texto_enriquecido(p: Dict[str, Any]) -> str:
     nombres = p.get("nombre del pictograma", [])
     if not isinstance(nombres, list):
@@ -70,104 +99,237 @@ def construir_texto_enriquecido(p: Dict[str, Any]) -> str:
         f"Equivalentes: {equivalentes}"
     )
 
-def insertar_pictogramas(datos: List[Dict[str, Any]], index):
-    vectores = []
-    total_pictogramas = len(datos)
+def construir_metadata(pictograma: Dict[str, Any]) -> Dict[str, Any]:
+    id_pictograma = str(pictograma["id del pictograma de ARASAAC"])
+    metadata = {
+        "id": id_pictograma,
+        "nombre del pictograma": ", ".join(pictograma.get("nombre del pictograma", [])) if isinstance(pictograma.get("nombre del pictograma"), list) else str(pictograma.get("nombre del pictograma", ""))
+    }
 
-    print(f"🚀 Procesando {total_pictogramas} pictogramas para el namespace '{NAMESPACE}'...")
-    print("-" * 60)
+    campos_extra = ["definicion", "categoria", "subcategoria", "origen", "tipo_de_coccion", "forma_de_servir"]
+    for campo in campos_extra:
+        valor = pictograma.get(campo)
+        if valor is not None:
+            metadata[campo] = str(valor)
+
+    for campo_lista in ["ingredientes", "equivalentes"]:
+        valor = pictograma.get(campo_lista)
+        if isinstance(valor, list):
+            lista_limpia = [str(v) for v in valor if isinstance(v, str)]
+            if lista_limpia:
+                metadata[campo_lista] = lista_limpia
 
+    return metadata
+
+def construir_vector(pictograma: Dict[str, Any], embedding: List[float]) -> Dict[str, Any]:
+    return {
+        "id": str(pictograma["id del pictograma de ARASAAC"]),
+        "values": embedding,
+        "metadata": construir_metadata(pictograma)
+    }
+
+def pictogramas_validos(datos: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    validos = []
     for idx, pictograma in enumerate(datos):
         if "id del pictograma de ARASAAC" not in pictograma:
             print(f"⚠️ Pictograma en índice {idx} no tiene ID de ARASAAC. Saltando...")
             continue
+        validos.append(pictograma)
+    return validos
 
-        id_pictograma = str(pictograma["id del pictograma de ARASAAC"])
-        texto = construir_texto_enriquecido(pictograma)
-
-        print(f"[{idx+1}/{total_pictogramas}] Generando embedding para ID {id_pictograma}")
-        embedding = generar_embedding(texto)
+def insertar_pictogramas(datos: List[Dict[str, Any]], index):
+    total_pictogramas = len(datos)
 
-        metadata = {
-            "id": id_pictograma,
-            "nombre del pictograma": ", ".join(pictograma.get("nombre del pictograma", [])) if isinstance(pictograma.get("nombre del pictograma"), list) else str(pictograma.get("nombre del pictograma", ""))
-        }
+    print(f"🚀 Procesando {total_pictogramas} pictogramas para el namespace '{NAMESPACE}'...")
+    print("-" * 60)
 
-        campos_extra = ["definicion", "categoria", "subcategoria", "origen", "tipo_de_coccion", "forma_de_servir"]
-        for campo in campos_extra:
-            valor = pictograma.get(campo)
-            if valor is not None:
-                metadata[campo] = str(valor)
-
-        for campo_lista in ["ingredientes", "equivalentes"]:
-            valor = pictograma.get(campo_lista)
-            if isinstance(valor, list):
-                lista_limpia = [str(v) for v in valor if isinstance(v, str)]
-                if lista_limpia:
-                    metadata[campo_lista] = lista_limpia
-
-        vectores.append({
-            "id": id_pictograma,
-            "values": embedding,
-            "metadata": metadata
-        })
-
-        if len(vectores) >= 30:
-            print(f"🔄 Insertando lote de 30 vectores...")
-            index.upsert(vectors=vectores, namespace=NAMESPACE)
-            vectores = []
-
-    if vectores:
-        print(f"🔄 Insertando lote final de {len(vectores)} vectores...")
-        index.upsert(vectors=vectores, namespace=NAMESPACE)
+    validos = pictogramas_validos(datos)
+    textos = [construir_texto_enriquecido(p) for p in validos]
+    insertar_con_embeddings(validos, textos, construir_vector, index, NAMESPACE)
+    registro.olvidar_versiones()
 
     print("🎉 Inserción finalizada.")
 
+def confirmar_borrado_consola(ids: List[str]) -> bool:
+    print(f"⚠️ {len(ids)} vectores del namespace '{NAMESPACE}' no están en el JSON "
+          f"(por ejemplo: {', '.join(ids[:5])})")
+    return input(f"¿Borrarlos del índice? Escriba 'borrar {len(ids)}' para confirmar: ").strip() == f"borrar {len(ids)}"
+
+def sincronizar_pictogramas(datos: List[Dict[str, Any]], index, nombre_indice: str = INDEX_NAME,
+                            confirmar_borrado=None) -> Dict[str, int]:
+    """
+    Como insertar_pictogramas, pero aplicando solo las diferencias con la última
+    sincronización del namespace: re-embebe los pictogramas que cambiaron y borra
+    los que ya no están en `datos` (si son muchos, solo con `confirmar_borrado`;
+    ver sincronizacion.sincronizar). Todos los campos de construir_metadata
+    también van en construir_texto_enriquecido, así que cualquier cambio
+    re-embebe: la actualización de solo metadata no se usa con estos pictogramas.
+    """
+    print(f"🚀 Sincronizando {len(datos)} pictogramas con el namespace '{NAMESPACE}'...")
+    print("-" * 60)
+
+    validos = pictogramas_validos(datos)
+    resumen = sincronizar(
+        validos,
+        [str(p["id del pictograma de ARASAAC"]) for p in validos],
+        [construir_texto_enriquecido(p) for p in validos],
+        [construir_metadata(p) for p in validos],
+        construir_vector, index, NAMESPACE, ruta_estado(nombre_indice, NAMESPACE),
+        confirmar_borrado=confirmar_borrado
+    )
+    registro.olvidar_versiones()
+
+    print("🎉 Sincronización finalizada.")
+    return resumen
+
+def construir_indice_local(datos: List[Dict[str, Any]]) -> IndiceLocal:
+    """
+    Arma un IndiceLocal con los mismos vectores y metadatos que se suben a Pinecone.
+    Los embeddings salen del cache en disco, así que sobre un catálogo ya indexado no hay llamadas a OpenAI.
+    """
+    indice = IndiceLocal(DIMENSION)
+    insertar_pictogramas(datos, indice)
+    return indice
+
 # Resto del código no necesita cambios
 
-def buscar_pictograma(consulta: str, index_name=None, top_k: int = 5):
+def coincidencias_lexicas(consulta: str, top_k: int, corregir: bool = True) -> List[Dict[str, Any]]:
+    """
+    Resultados del índice léxico para la consulta. Si no hay y la consulta
+    tiene palabras desconocidas, se prueba con la versión corregida; la
+    corrección se acepta solo si así aparece una coincidencia. Si no, la
+    consulta sigue tal cual al cache y a la búsqueda semántica.
+    """
+    lexico = obtener_indice_lexico()
+    coincidencias = lexico.buscar(consulta, top_k)
+    if coincidencias or not corregir:
+        return coincidencias
+    corregida = obtener_corrector().corregir(consulta)
+    if corregida == consulta:
+        return []
+    coincidencias = lexico.buscar(corregida, top_k)
+    if coincidencias:
+        print(f"✏️ Consulta corregida: '{consulta}' -> '{corregida}'")
+    return coincidencias
+
+def buscar_pictograma(consulta: str, index_name=None, top_k: int = 5,
+                      usar_cache: bool = True, usar_lexico: bool = True, corregir: bool = True):
     """
     Busca pictogramas que coincidan semánticamente con la consulta.
     Búsqueda limitada al namespace 'pictogramas_ada'.
+    Si la consulta es un nombre conocido (exacto o casi exacto, o tras corregir
+    errores de tipeo/OCR contra el vocabulario del catálogo) se resuelve con el
+    índice léxico, sin llamar a OpenAI ni a Pinecone.
+    Los resultados semánticos se cachean por consulta normalizada y versión del namespace.
     """
     print(f"🔍 Buscando coincidencias para: '{consulta}' en namespace '{NAMESPACE}'")
     
-    # Determinar el índice a usar
-    if index_name is None:
-        index = conectar_a_indice(INDEX_NAME)
-    elif isinstance(index_name, str):
-        index = conectar_a_indice(index_name)
-    else:
-        index = index_name
+    if usar_lexico:
+        coincidencias = coincidencias_lexicas(consulta, top_k, corregir)
+        if coincidencias:
+            print(f"⚡ Coincidencia léxica: {len(coincidencias)} pictogramas")
+            return coincidencias
     
+    index = _resolver_indice(index_name)
     if index is None:
         print("❌ No se pudo conectar al índice.")
         return []
     
-    consulta_enriquecida = f"Plato o postre gastronómico: {consulta}. Buscar equivalentes y similares."
-    print(f"🔍 Consulta enriquecida: '{consulta_enriquecida}'")
-    
-    inicio_tiempo = time.time()
-    embedding_consulta = generar_embedding(consulta_enriquecida)
-    tiempo_embedding = time.time() - inicio_tiempo
-    print(f"✓ Embedding de consulta generado en {tiempo_embedding:.2f} segundos")
-    
-    inicio_tiempo = time.time()
-    resultados = index.query(
-        vector=embedding_consulta,
-        top_k=top_k,
-        include_metadata=True,
-        namespace=NAMESPACE
+    if not usar_cache:
+        return _buscar_semantico(consulta, index, top_k)
+
+    cache = obtener_cache_busquedas()
+    hits_previos = cache.hits + cache.obsoletos
+    resultados = cache.obtener_o_calcular(
+        consulta, namespace_cache(), top_k, registro.version_namespace(index, NAMESPACE),
+        lambda: _buscar_semantico(consulta, index, top_k),
+        es_negativo=sin_coincidencia_confiable
     )
-    tiempo_busqueda = time.time() - inicio_tiempo
-    print(f"✓ Búsqueda completada en {tiempo_busqueda:.2f} segundos en namespace '{NAMESPACE}'")
-    
+    if cache.hits + cache.obsoletos > hits_previos:
+        print(f"⚡ Resultado servido desde cache ({len(resultados)} pictogramas)")
+    return resultados
+
+def buscar_pictogramas_lote(consultas: List[str], index_name=None, top_k: int = 5,
+                            usar_cache: bool = True, usar_lexico: bool = True,
+                            corregir: bool = True) -> List[List[Dict[str, Any]]]:
+    """
+    Resuelve muchas consultas (por ejemplo, todos los ítems de un menú) de una vez.
+    Las consultas repetidas se resuelven una sola vez, las que quedan sin resolver
+    por léxico o cache se embeben en una única llamada a OpenAI, y las búsquedas
+    en el índice corren en paralelo (o en un solo producto matricial si el índice es local).
+    Devuelve una lista de resultados por consulta, en el mismo orden de entrada.
+    """
+    print(f"🔍 Buscando {len(consultas)} consultas en lote en namespace '{NAMESPACE}'")
+
+    resueltas: Dict[str, List[Dict[str, Any]]] = {}
+    pendientes: Dict[str, str] = {}
+    claves = []
+    for consulta in consultas:
+        clave = normalizar_consulta(consulta)
+        claves.append(clave)
+        if clave in resueltas or clave in pendientes:
+            continue
+        if usar_lexico:
+            coincidencias = coincidencias_lexicas(consulta, top_k, corregir)
+            if coincidencias:
+                resueltas[clave] = coincidencias
+                continue
+        pendientes[clave] = consulta
+    print(f"⚡ {len(consultas) - len(pendientes)} consultas resueltas sin búsqueda semántica "
+          f"({len(set(claves))} únicas de {len(consultas)})")
+
+    index = _resolver_indice(index_name) if pendientes else None
+    if pendientes and index is None:
+        print("❌ No se pudo conectar al índice.")
+        pendientes = {}
+
+    if pendientes and usar_cache:
+        cache = obtener_cache_busquedas()
+        version = registro.version_namespace(index, NAMESPACE)
+        for clave, consulta in list(pendientes.items()):
+            cacheado = cache.consultar(
+                consulta, namespace_cache(), top_k, version,
+                lambda consulta=consulta: _buscar_semantico(consulta, index, top_k),
+                es_negativo=sin_coincidencia_confiable
+            )
+            if cacheado is not None:
+                resueltas[clave] = cacheado
+                del pendientes[clave]
+
+    if pendientes:
+        calculadas = _buscar_semantico_lote(list(pendientes.values()), index, top_k)
+        for (clave, consulta), resultado in zip(pendientes.items(), calculadas):
+            resueltas[clave] = resultado
+            if usar_cache:
+                cache.guardar(cache.clave(consulta, namespace_cache(), top_k, version),
+                              resultado, sin_coincidencia_confiable(resultado))
+
+    print(f"✅ Lote resuelto: {len(pendientes)} búsquedas semánticas para {len(consultas)} consultas")
+    return [copy.deepcopy(resueltas.get(clave, [])) for clave in claves]
+
+def _resolver_indice(index_name):
+    # Los handles salen del registro: no se crea un pc.Index ni se llama a describe_index_stats por búsqueda
+    if index_name is None:
+        return registro.indice(INDEX_NAME)
+    if isinstance(index_name, str):
+        return registro.indice(index_name)
+    return index_name
+
+def namespace_cache() -> str:
+    # Los resultados híbridos y los solo vectoriales no se mezclan en el cache
+    return NAMESPACE + ("+bm25" if BUSQUEDA_HIBRIDA else "")
+
+def sin_coincidencia_confiable(resultados: List[Dict[str, Any]]) -> bool:
+    return not resultados or max(r["score"] for r in resultados) < UMBRAL_CONFIANZA
+
+def procesar_coincidencias(matches) -> List[Dict[str, Any]]:
+    """Convierte los matches del índice en pictogramas únicos con los metadatos que usamos."""
     pictogramas_encontrados = []
     ids_unicos = set()
     
-    print(f"📋 Encontrados {len(resultados['matches'])} coincidencias (antes de eliminar duplicados)")
+    print(f"📋 Encontrados {len(matches)} coincidencias (antes de eliminar duplicados)")
     
-    for match in resultados["matches"]:
+    for match in matches:
         id_original = match["metadata"]["id"]
         
         if id_original in ids_unicos:
@@ -186,9 +348,65 @@ def buscar_pictograma(consulta: str, index_name=None, top_k: int = 5):
         
         pictogramas_encontrados.append(pictograma_info)
     
+    return pictogramas_encontrados
+
+def texto_consulta(consulta: str) -> str:
+    return f"Plato o postre gastronómico: {consulta}. Buscar equivalentes y similares."
+
+def resultados_de_matches(consulta: str, matches, top_k: int, candidatos: int, hibrido: bool) -> List[Dict[str, Any]]:
+    pictogramas_encontrados = procesar_coincidencias(matches)
+    if hibrido:
+        pictogramas_encontrados = fusionar_resultados(consulta, pictogramas_encontrados, candidatos)
+    return pictogramas_encontrados[:top_k]
+
+def _buscar_semantico(consulta: str, index, top_k: int, hibrido: bool = BUSQUEDA_HIBRIDA) -> List[Dict[str, Any]]:
+    consulta_enriquecida = texto_consulta(consulta)
+    print(f"🔍 Consulta enriquecida: '{consulta_enriquecida}'")
+    
+    inicio_tiempo = time.time()
+    embedding_consulta = generar_embedding(consulta_enriquecida)
+    tiempo_embedding = time.time() - inicio_tiempo
+    print(f"✓ Embedding de consulta generado en {tiempo_embedding:.2f} segundos")
+    
+    candidatos = max(top_k, CANDIDATOS_FUSION) if hibrido else top_k
+    inicio_tiempo = time.time()
+    resultados = index.query(
+        vector=embedding_consulta,
+        top_k=candidatos,
+        include_metadata=True,
+        namespace=NAMESPACE
+    )
+    tiempo_busqueda = time.time() - inicio_tiempo
+    print(f"✓ Búsqueda completada en {tiempo_busqueda:.2f} segundos en namespace '{NAMESPACE}'")
+    
+    pictogramas_encontrados = resultados_de_matches(consulta, resultados["matches"], top_k, candidatos, hibrido)
     print(f"✅ Resultados únicos encontrados: {len(pictogramas_encontrados)}")
     return pictogramas_encontrados
 
+def _buscar_semantico_lote(consultas: List[str], index, top_k: int,
+                           hibrido: bool = BUSQUEDA_HIBRIDA) -> List[List[Dict[str, Any]]]:
+    inicio_tiempo = time.time()
+    embeddings = generar_embeddings([texto_consulta(c) for c in consultas])
+    print(f"✓ {len(consultas)} embeddings de consulta generados en {time.time() - inicio_tiempo:.2f} segundos")
+
+    candidatos = max(top_k, CANDIDATOS_FUSION) if hibrido else top_k
+    inicio_tiempo = time.time()
+    if hasattr(index, "query_lote"):
+        respuestas = index.query_lote(vectores=embeddings, top_k=candidatos,
+                                      namespace=NAMESPACE, include_metadata=True)
+    else:
+        with ThreadPoolExecutor(max_workers=HILOS_CONSULTA) as pool:
+            respuestas = list(pool.map(
+                lambda e: index.query(vector=e, top_k=candidatos, include_metadata=True, namespace=NAMESPACE),
+                embeddings
+            ))
+    print(f"✓ {len(consultas)} búsquedas completadas en {time.time() - inicio_tiempo:.2f} segundos")
+
+    return [
+        resultados_de_matches(consulta, respuesta["matches"], top_k, candidatos, hibrido)
+        for consulta, respuesta in zip(consultas, respuestas)
+    ]
+
 
 def mostrar_resultados(resultados):
     """Muestra los resultados de forma amigable"""
@@ -243,8 +461,19 @@ def cargar_datos(ruta_archivo):
 
 def main():
     try:
-        # Conectar al índice
-        index = conectar_a_indice()
+        # Conectar al índice (o armar el índice local si está configurado)
+        # Nombre con el que se guardan los hashes de la sincronización
+        nombre_indice = INDEX_NAME
+        if INDICE_LOCAL_BUNDLE:
+            index = IndiceLocal(DIMENSION)
+            manifiesto = index.cargar_bundle(INDICE_LOCAL_BUNDLE, NAMESPACE)
+            nombre_indice = "bundle-" + os.path.basename(os.path.normpath(INDICE_LOCAL_BUNDLE))
+            print(f"📂 Bundle {INDICE_LOCAL_BUNDLE} montado: {manifiesto['cantidad']} vectores (versión {manifiesto['version']})")
+        elif INDICE_LOCAL_JSON:
+            index = construir_indice_local(cargar_datos(INDICE_LOCAL_JSON))
+            nombre_indice = "local"
+        else:
+            index = conectar_a_indice()
         if index is None:
             return
         
@@ -253,9 +482,10 @@ def main():
             print("\n" + "=" * 50)
             print(f"MENÚ DE OPCIONES (Namespace: {NAMESPACE}):")
             print("1. Cargar e insertar pictogramas desde JSON")
-            print("2. Buscar pictogramas")
-            print("3. Salir")
-            opcion = input("Seleccione una opción (1-3): ")
+            print("2. Sincronizar pictogramas desde JSON (solo cambios)")
+            print("3. Buscar pictogramas")
+            print("4. Salir")
+            opcion = input("Seleccione una opción (1-4): ")
             
             if opcion == "1":
                 ruta_archivo = input("Ingrese la ruta del archivo JSON: ")
@@ -263,10 +493,15 @@ def main():
                 if datos:
                     insertar_pictogramas(datos, index)
             elif opcion == "2":
+                ruta_archivo = input("Ingrese la ruta del archivo JSON: ")
+                datos = cargar_datos(ruta_archivo)
+                if datos:
+                    sincronizar_pictogramas(datos, index, nombre_indice, confirmar_borrado_consola)
+            elif opcion == "3":
                 consulta = input("\n🔍 Ingrese consulta: ")
                 resultados = buscar_pictograma(consulta, index)
                 mostrar_resultados(resultados)
-            elif opcion == "3":
+            elif opcion == "4":
                 print("¡Hasta pronto!")
                 break
             else:
@@ -0,0 +1,379 @@
+import asyncio
+import json
+import os
+import random
+import time
+from collections import deque
+from typing import List, Dict, Any, Callable, Optional, Set, Tuple
+
+from openai import AsyncOpenAI
+from dotenv import load_dotenv
+
+from embeddings import estimar_tokens
+from indice_lexico import plegar
+
+load_dotenv()
+
+MODELO_CHAT = "gpt-3.5-turbo"
+MAX_EN_VUELO = int(os.environ.get("ENRIQUECIMIENTO_EN_VUELO", 8))  # solicitudes simultáneas
+LIMITE_RPM = int(os.environ.get("OPENAI_RPM", 500))  # requests por minuto de la cuenta
+LIMITE_TPM = int(os.environ.get("OPENAI_TPM", 200_000))  # tokens por minuto de la cuenta
+MAX_INTENTOS = 4
+ESPERA_BASE = 1.0  # segundos antes del primer reintento; se duplica en cada intento
+ESPERA_MAXIMA = 30.0
+
+# Tamaño de lote adaptativo: cuántos nombres entran en una respuesta
+PRESUPUESTO_SALIDA = int(os.environ.get("ENRIQUECIMIENTO_MAX_TOKENS", 4000))  # gpt-3.5-turbo admite hasta 4096
+TOKENS_POR_ITEM_INICIAL = 300.0  # equivale al ajuste manual anterior: max_tokens=1500 para lotes de 5
+MAX_ITEMS_LOTE = 40
+MARGEN_SALIDA = 1.2  # holgura sobre la estimación al fijar max_tokens
+ALFA_ESTIMACION = 0.3  # peso de la última observación en el promedio móvil
+FACTOR_TRUNCADO = 1.25  # cuánto se agranda la estimación después de una respuesta truncada
+
+
+class LimitadorTokens:
+    """
+    Token bucket doble: uno para requests por minuto y otro para tokens por minuto.
+    Cada solicitud espera hasta que ambos tengan saldo; el saldo se repone de forma
+    continua, así que el ritmo sostenido converge al límite de la cuenta.
+    """
+
+    def __init__(self, rpm: int = LIMITE_RPM, tpm: int = LIMITE_TPM):
+        self.capacidades = (float(rpm), float(tpm))
+        self.saldos = [float(rpm), float(tpm)]
+        self.tasas = (rpm / 60.0, tpm / 60.0)
+        self._ultimo = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _reponer(self):
+        ahora = time.monotonic()
+        transcurrido = ahora - self._ultimo
+        self._ultimo = ahora
+        for i in range(2):
+            self.saldos[i] = min(self.capacidades[i], self.saldos[i] + transcurrido * self.tasas[i])
+
+    async def adquirir(self, tokens: int):
+        pedido = (1.0, float(min(tokens, self.capacidades[1])))
+        async with self._lock:
+            while True:
+                self._reponer()
+                faltante = max((pedido[i] - self.saldos[i]) / self.tasas[i] for i in range(2))
+                if faltante <= 0:
+                    self.saldos[0] -= pedido[0]
+                    self.saldos[1] -= pedido[1]
+                    return
+                await asyncio.sleep(faltante)
+
+
+class ParserArrayJSON:
+    """
+    Parser incremental de un array JSON: recibe la respuesta en fragmentos y
+    devuelve cada elemento apenas se cierra. Lo previo al '[' (por ejemplo un
+    bloque ```json) se ignora, y un elemento malformado no invalida a los demás:
+    su texto queda en `invalidos`.
+    """
+
+    def __init__(self):
+        self.invalidos: List[str] = []
+        self.terminado = False
+        self._dentro = False
+        self._buffer: List[str] = []
+        self._profundidad = 0
+        self._en_string = False
+        self._escape = False
+
+    def _cerrar_elemento(self, elementos: list):
+        texto = "".join(self._buffer).strip()
+        self._buffer = []
+        if not texto:
+            return
+        try:
+            elementos.append(json.loads(texto))
+        except json.JSONDecodeError:
+            self.invalidos.append(texto)
+
+    def alimentar(self, fragmento: str) -> list:
+        elementos = []
+        for c in fragmento:
+            if self.terminado:
+                break
+            if not self._dentro:
+                self._dentro = c == "["
+                continue
+            if self._en_string:
+                self._buffer.append(c)
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._en_string = False
+                continue
+            if c == '"':
+                self._en_string = True
+                self._buffer.append(c)
+            elif c in "{[":
+                self._profundidad += 1
+                self._buffer.append(c)
+            elif c in "}]":
+                if self._profundidad == 0:
+                    # ']' que cierra el array
+                    self._cerrar_elemento(elementos)
+                    self.terminado = True
+                    continue
+                self._profundidad -= 1
+                self._buffer.append(c)
+                if self._profundidad == 0:
+                    self._cerrar_elemento(elementos)
+            elif c == "," and self._profundidad == 0:
+                self._cerrar_elemento(elementos)
+            else:
+                self._buffer.append(c)
+        return elementos
+
+
+def emparejar(elemento: Any, nombres: List[str], pendientes: Set[int]) -> List[int]:
+    """
+    Posiciones de `nombres` (entre las pendientes) a las que corresponde el
+    elemento de la respuesta, comparando su campo "nombre" sin tildes ni signos.
+    Si no hay coincidencia exacta se acepta una parcial solo si no es ambigua.
+    """
+    if not isinstance(elemento, dict):
+        return []
+    nombre = elemento.get("nombre", "")
+    if isinstance(nombre, list):
+        nombre = nombre[0] if nombre else ""
+    nombre = plegar(str(nombre))
+    if not nombre:
+        return []
+    exactos = [i for i in pendientes if plegar(nombres[i]) == nombre]
+    if exactos:
+        return exactos
+    parciales = [i for i in pendientes if plegar(nombres[i]) in nombre or nombre in plegar(nombres[i])]
+    if len({plegar(nombres[i]) for i in parciales}) == 1:
+        return parciales
+    return []
+
+
+class FormatoObjetos:
+    """
+    Formato original: una lista de objetos con todos los campos, emparejados
+    con su entrada por el campo "nombre".
+    """
+
+    def __init__(self, construir_prompt: Callable[[List[str]], str]):
+        self.construir_prompt = construir_prompt
+
+    def prompt(self, nombres: List[str]) -> str:
+        return self.construir_prompt(nombres)
+
+    def interpretar(self, elemento: Any, nombres: List[str], pedidos: List[int],
+                    pendientes: Set[int]) -> List[Tuple[int, dict]]:
+        return [(i, elemento) for i in emparejar(elemento, nombres, pendientes)]
+
+
+class FormatoCompacto:
+    """
+    Formato compacto: un array por alimento, sin nombres de campo, que empieza
+    con el número del alimento en la lista del prompt y sigue con los campos en
+    el orden de `campos`. Ahorra repetir los nombres de campo en cada elemento
+    (los tokens de salida son los que más pesan en la latencia); al recibirlo se
+    expande al mismo objeto que devuelve FormatoObjetos.
+    """
+
+    def __init__(self, campos: List[Tuple[str, str]]):
+        self.campos = campos  # [(campo, descripción para el prompt)]
+
+    def prompt(self, nombres: List[str]) -> str:
+        lista = "\n".join([f"{i+1}. {n}" for i, n in enumerate(nombres)])
+        orden = ", ".join(["número"] + [campo for campo, _ in self.campos])
+        descripciones = "\n".join(f"- {campo}" + (f" ({descripcion})" if descripcion else "")
+                                   for campo, descripcion in self.campos)
+        return (
+            "Genera una descripción detallada y etiquetas para los siguientes alimentos. "
+            "Responde solo con un array JSON que tenga un array por alimento, sin nombres de campo, "
+            f"con los valores en este orden exacto: [{orden}]. "
+            "El número es el del alimento en la lista.\n"
+            f"Campos:\n{descripciones}\n\n"
+            f"Alimentos:\n{lista}"
+        )
+
+    def interpretar(self, elemento: Any, nombres: List[str], pedidos: List[int],
+                    pendientes: Set[int]) -> List[Tuple[int, dict]]:
+        if not isinstance(elemento, list) or len(elemento) != len(self.campos) + 1:
+            return []
+        try:
+            numero = int(elemento[0])
+        except (TypeError, ValueError):
+            return []
+        if not 1 <= numero <= len(pedidos) or pedidos[numero - 1] not in pendientes:
+            return []
+        i = pedidos[numero - 1]
+        resultado = {"nombre": nombres[i]}
+        resultado.update(zip((campo for campo, _ in self.campos), elemento[1:]))
+        return [(i, resultado)]
+
+
+class EstimadorLote:
+    """
+    Estima los tokens de salida por pictograma a partir de las respuestas
+    anteriores (promedio móvil exponencial) y con eso decide cuántos nombres
+    pedir por solicitud sin pasarse del presupuesto de salida. Una respuesta
+    truncada agranda la estimación (lotes más chicos); las respuestas que
+    sobran presupuesto la van achicando (lotes más grandes).
+    """
+
+    def __init__(self, presupuesto: int = PRESUPUESTO_SALIDA,
+                 tokens_por_item: float = TOKENS_POR_ITEM_INICIAL, max_items: int = MAX_ITEMS_LOTE):
+        self.presupuesto = presupuesto
+        self.tokens_por_item = tokens_por_item
+        self.max_items = max_items
+
+    def tamanio(self) -> int:
+        return max(1, min(self.max_items, int(self.presupuesto / (self.tokens_por_item * MARGEN_SALIDA))))
+
+    def max_tokens(self, cantidad: int) -> int:
+        return min(self.presupuesto, int(cantidad * self.tokens_por_item * MARGEN_SALIDA) + 50)
+
+    def observar(self, recibidos: int, tokens_salida: int, truncado: bool):
+        if recibidos:
+            muestra = tokens_salida / recibidos
+            self.tokens_por_item += ALFA_ESTIMACION * (muestra - self.tokens_por_item)
+        if truncado:
+            self.tokens_por_item *= FACTOR_TRUNCADO
+
+
+class MotorEnriquecimiento:
+    """
+    Envía los nombres a enriquecer a OpenAI en paralelo, con un máximo de
+    `max_en_vuelo` solicitudes simultáneas y respetando los límites RPM/TPM.
+    Cada solicitud lleva tantos nombres como indica el EstimadorLote, y el
+    formato (FormatoObjetos o FormatoCompacto) arma el prompt e interpreta
+    cada elemento de la respuesta.
+    Las respuestas llegan en streaming y cada elemento se entrega en cuanto se
+    cierra, emparejado por nombre con su entrada; los nombres que faltaron o
+    vinieron mal vuelven a la cola, y los errores de la API se esperan con
+    backoff exponencial con jitter.
+    """
+
+    def __init__(self, formato, logger,
+                 max_en_vuelo: int = MAX_EN_VUELO, rpm: int = LIMITE_RPM, tpm: int = LIMITE_TPM,
+                 modelo: str = MODELO_CHAT, temperature: float = 0.7, max_intentos: int = MAX_INTENTOS,
+                 estimador: Optional[EstimadorLote] = None):
+        self.formato = formato  # FormatoObjetos o FormatoCompacto
+        self.logger = logger
+        self.max_en_vuelo = max_en_vuelo
+        self.rpm = rpm
+        self.tpm = tpm
+        self.modelo = modelo
+        self.temperature = temperature
+        self.max_intentos = max_intentos
+        self.estimador = estimador or EstimadorLote()
+
+    async def _llamar(self, cliente: AsyncOpenAI, limitador: LimitadorTokens, nombres: List[str],
+                      pendientes: Set[int], al_recibir: Callable[[int, dict], None]) -> Tuple[int, int, bool]:
+        """
+        Una solicitud en streaming por los nombres pendientes; los que llegan bien
+        salen de `pendientes`. Devuelve (recibidos, tokens de salida, truncada).
+        """
+        pedidos = sorted(pendientes)
+        prompt = self.formato.prompt([nombres[i] for i in pedidos])
+        max_tokens = self.estimador.max_tokens(len(pedidos))
+        # OpenAI descuenta max_tokens del límite TPM al recibir la solicitud
+        await limitador.adquirir(estimar_tokens(prompt) + max_tokens)
+        stream = await cliente.chat.completions.create(
+            model=self.modelo,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            temperature=self.temperature,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        parser = ParserArrayJSON()
+        motivo_fin = None
+        texto = []
+        tokens_salida = None
+        async for chunk in stream:
+            if getattr(chunk, "usage", None):
+                tokens_salida = chunk.usage.completion_tokens
+            if not chunk.choices:
+                continue
+            eleccion = chunk.choices[0]
+            fragmento = eleccion.delta.content or ""
+            texto.append(fragmento)
+            for elemento in parser.alimentar(fragmento):
+                interpretados = self.formato.interpretar(elemento, nombres, pedidos, pendientes)
+                if not interpretados:
+                    self.logger.warning(f"Elemento sin entrada correspondiente: {str(elemento)[:200]}")
+                for i, resultado in interpretados:
+                    pendientes.discard(i)
+                    al_recibir(i, resultado)
+            motivo_fin = eleccion.finish_reason or motivo_fin
+        truncada = motivo_fin == "length"
+        if truncada:
+            self.logger.warning(f"Respuesta truncada por max_tokens={max_tokens} ({len(pedidos)} nombres)")
+        for invalido in parser.invalidos:
+            self.logger.error(f"Elemento con JSON inválido: {invalido[:200]}")
+        if tokens_salida is None:
+            tokens_salida = estimar_tokens("".join(texto))
+        return len(pedidos) - len(pendientes), tokens_salida, truncada
+
+    async def _trabajador(self, cliente: AsyncOpenAI, limitador: LimitadorTokens, nombres: List[str],
+                          cola: deque, intentos: Dict[int, int], omitidos: List[int],
+                          al_recibir: Callable[[int, dict], None],
+                          al_completar: Optional[Callable[[List[int], List[int]], None]]):
+        errores_seguidos = 0
+        while cola:
+            tamanio = self.estimador.tamanio()
+            posiciones = [cola.popleft() for _ in range(min(tamanio, len(cola)))]
+            pendientes = set(posiciones)
+            try:
+                self.logger.info(f"Enviando solicitud para lote: {[nombres[i] for i in posiciones]}")
+                recibidos, tokens_salida, truncada = await self._llamar(cliente, limitador, nombres,
+                                                                        pendientes, al_recibir)
+                self.estimador.observar(recibidos, tokens_salida, truncada)
+                errores_seguidos = 0
+            except Exception as e:
+                self.logger.error(f"Error generando lote: {e}")
+                errores_seguidos += 1
+
+            for i in sorted(pendientes):
+                intentos[i] += 1
+                if intentos[i] >= self.max_intentos:
+                    omitidos.append(i)
+                    self.logger.error(f"Omitido después de {self.max_intentos} intentos: {nombres[i]}")
+                else:
+                    cola.append(i)
+            if al_completar is not None:
+                al_completar(posiciones, sorted(pendientes))
+
+            if errores_seguidos:
+                espera = min(ESPERA_BASE * 2 ** (errores_seguidos - 1), ESPERA_MAXIMA) * random.uniform(0.5, 1.5)
+                self.logger.warning(f"Reintentando en {espera:.1f}s ({errores_seguidos} errores seguidos)")
+                await asyncio.sleep(espera)
+
+    async def _procesar(self, nombres: List[str], al_recibir: Callable[[int, dict], None],
+                        al_completar: Optional[Callable[[List[int], List[int]], None]]) -> List[int]:
+        cliente = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+        limitador = LimitadorTokens(self.rpm, self.tpm)
+        cola = deque(range(len(nombres)))
+        intentos = {i: 0 for i in range(len(nombres))}
+        omitidos: List[int] = []
+        try:
+            await asyncio.gather(*(
+                self._trabajador(cliente, limitador, nombres, cola, intentos, omitidos, al_recibir, al_completar)
+                for _ in range(self.max_en_vuelo)
+            ))
+        finally:
+            await cliente.close()
+        return sorted(omitidos)
+
+    def procesar(self, nombres: List[str], al_recibir: Callable[[int, dict], None],
+                 al_completar: Optional[Callable[[List[int], List[int]], None]] = None) -> List[int]:
+        """
+        Enriquece todos los nombres y devuelve las posiciones que se omitieron tras
+        agotar los intentos. `al_recibir(posición, resultado)` se llama por cada
+        elemento apenas llega y `al_completar(posiciones_pedidas, posiciones_faltantes)`
+        al terminar cada solicitud; ninguno de los dos en un orden garantizado.
+        """
+        return asyncio.run(self._procesar(nombres, al_recibir, al_completar))
@@ -0,0 +1,159 @@
+import threading
+import time
+import uuid
+from typing import Dict, Any, Callable, Optional
+
+TTL_STATS = 60  # segundos que una lectura de describe_index_stats o de una versión se considera vigente
+INTERVALO_REFRESCO = 30  # cada cuánto el hilo de fondo refresca las estadísticas
+# Namespace con un vector marcador por namespace de datos; su metadata "version"
+# cambia con cada escritura y forma parte de las claves del cache de búsquedas
+NAMESPACE_VERSIONES = "__versiones__"
+
+def publicar_version(index, namespace: str, version: Optional[str] = None) -> Optional[str]:
+    """
+    Publica una versión nueva del contenido de `namespace` (por defecto, una
+    al azar). Hay que llamarla después de cada escritura: upsert, update o
+    delete. Los índices locales calculan su versión del contenido y no la necesitan.
+    """
+    if hasattr(index, "version"):
+        return None
+    version = version or uuid.uuid4().hex[:16]
+    dimension = index.describe_index_stats().get("dimension")
+    marcador = [1.0] + [0.0] * (dimension - 1)  # Pinecone no acepta vectores en cero
+    index.upsert(vectors=[{"id": namespace, "values": marcador, "metadata": {"version": version}}],
+                 namespace=NAMESPACE_VERSIONES)
+    print(f"🏷️ Versión publicada para '{namespace}': {version}")
+    return version
+
+def version_de_fetch(respuesta, namespace: str) -> Optional[str]:
+    """Versión del marcador en la respuesta de fetch (cliente sync o async), o None si no hay."""
+    vectores = respuesta.vectors if hasattr(respuesta, "vectors") else respuesta.get("vectors", {})
+    vector = (vectores or {}).get(namespace)
+    if vector is None:
+        return None
+    metadata = vector.metadata if hasattr(vector, "metadata") else vector.get("metadata")
+    return (metadata or {}).get("version")
+
+def leer_version(index, namespace: str) -> Optional[str]:
+    return version_de_fetch(index.fetch(ids=[namespace], namespace=NAMESPACE_VERSIONES), namespace)
+
+
+class RegistroIndices:
+    """
+    Registro de índices del proceso: cada handle se crea una sola vez y las
+    estadísticas (describe_index_stats) se cachean con TTL. Un hilo de fondo
+    las refresca y registra si el índice responde, así que las búsquedas no
+    pagan esa llamada extra.
+    """
+
+    def __init__(self, crear_indice: Callable[[str], Any],
+                 ttl_stats: float = TTL_STATS, intervalo_refresco: float = INTERVALO_REFRESCO):
+        self._crear_indice = crear_indice
+        self.ttl_stats = ttl_stats
+        self.intervalo_refresco = intervalo_refresco
+        self._indices: Dict[str, Any] = {}
+        self._nombres: Dict[int, str] = {}
+        self._stats: Dict[str, tuple] = {}  # nombre -> (momento, stats)
+        self._saludable: Dict[str, bool] = {}
+        self._versiones: Dict[tuple, tuple] = {}  # (nombre, namespace) -> (momento, versión)
+        self._lock = threading.Lock()
+        self._hilo: Optional[threading.Thread] = None
+
+    def indice(self, nombre: str):
+        """Devuelve el handle del índice, creándolo la primera vez."""
+        with self._lock:
+            index = self._indices.get(nombre)
+            if index is None:
+                index = self._crear_indice(nombre)
+                self._indices[nombre] = index
+                self._nombres[id(index)] = nombre
+        self._iniciar_refresco()
+        return index
+
+    def _refrescar(self, nombre: str) -> Optional[Dict[str, Any]]:
+        try:
+            stats = self._indices[nombre].describe_index_stats()
+        except Exception as e:
+            self._saludable[nombre] = False
+            print(f"⚠️ No se pudieron leer las estadísticas de {nombre}: {e}")
+            return None
+        self._stats[nombre] = (time.time(), stats)
+        self._saludable[nombre] = True
+        return stats
+
+    def _bucle_refresco(self):
+        while True:
+            time.sleep(self.intervalo_refresco)
+            for nombre in list(self._indices):
+                self._refrescar(nombre)
+            for nombre, namespace in list(self._versiones):
+                self._refrescar_version(nombre, namespace)
+
+    def _iniciar_refresco(self):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle_refresco, name="refresco-indices", daemon=True)
+                self._hilo.start()
+
+    def estadisticas(self, nombre: str) -> Optional[Dict[str, Any]]:
+        """
+        Estadísticas cacheadas del índice. Solo se consultan en el momento si
+        nunca se leyeron o si el hilo de fondo dejó de refrescarlas más allá del TTL.
+        """
+        self.indice(nombre)
+        guardadas = self._stats.get(nombre)
+        if guardadas is not None and time.time() - guardadas[0] < self.ttl_stats:
+            return guardadas[1]
+        stats = self._refrescar(nombre)
+        if stats is None and guardadas is not None:
+            return guardadas[1]
+        return stats
+
+    def saludable(self, nombre: str) -> Optional[bool]:
+        """Resultado del último refresco: True, False, o None si todavía no se consultó."""
+        return self._saludable.get(nombre)
+
+    def vectores_en_namespace(self, nombre: str, namespace: str) -> int:
+        stats = self.estadisticas(nombre)
+        if not stats:
+            return 0
+        namespaces = stats.get("namespaces", {})
+        return namespaces[namespace]["vector_count"] if namespace in namespaces else 0
+
+    def _refrescar_version(self, nombre: str, namespace: str) -> Optional[str]:
+        try:
+            version = leer_version(self._indices[nombre], namespace)
+        except Exception as e:
+            print(f"⚠️ No se pudo leer la versión de {nombre}/{namespace}: {e}")
+            guardada = self._versiones.get((nombre, namespace))
+            return guardada[1] if guardada else None
+        if version is None:
+            # Namespace cargado antes de que existieran las versiones publicadas
+            version = f"n{self.vectores_en_namespace(nombre, namespace)}"
+        self._versiones[(nombre, namespace)] = (time.time(), version)
+        return version
+
+    def olvidar_versiones(self):
+        """Tras escribir desde este proceso: la próxima búsqueda vuelve a leer la versión publicada."""
+        self._versiones.clear()
+
+    def version_namespace(self, index, namespace: str) -> str:
+        """
+        Versión de contenido del namespace para las claves del cache de búsquedas.
+        Los índices locales la calculan del contenido; para Pinecone es la que
+        publicó la última escritura (publicar_version), leída con el mismo TTL
+        que las estadísticas. Sin versión publicada se usa la cantidad de vectores.
+        """
+        if hasattr(index, "version"):
+            return index.version(namespace)
+        nombre = self._nombres.get(id(index))
+        if nombre is None:
+            # Handle creado por fuera del registro: se adopta para cachear sus estadísticas
+            nombre = f"externo-{id(index)}"
+            with self._lock:
+                self._indices[nombre] = index
+                self._nombres[id(index)] = nombre
+        guardada = self._versiones.get((nombre, namespace))
+        if guardada is not None and time.time() - guardada[0] < self.ttl_stats:
+            return guardada[1]
+        return self._refrescar_version(nombre, namespace) or f"n{self.vectores_en_namespace(nombre, namespace)}"
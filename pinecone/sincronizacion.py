@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Callable, Optional, Tuple
+
+from embeddings import insertar_con_embeddings
+from exportar_namespace import listar_ids
+from registro_indices import publicar_version, leer_version
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+RUTA_ESTADOS_SYNC = os.environ.get("SYNC_ESTADOS", os.path.join(DIRECTORIO, ".sync"))
+HILOS_UPDATE = 8  # updates de metadata en paralelo (Pinecone actualiza de a un id)
+TAMANIO_DELETE = 1000  # ids por llamada a delete
+# Más borrados que esto necesitan confirmación: un JSON equivocado (uno de prueba)
+# dejaría el namespace casi vacío
+MAX_BORRADOS_SIN_CONFIRMAR = 5
+
+def hash_contenido(valor: Any) -> str:
+    return hashlib.sha256(json.dumps(valor, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def ruta_estado(nombre_indice: str, namespace: str) -> str:
+    """Archivo con los hashes de un namespace: uno por índice y namespace."""
+    return os.path.join(RUTA_ESTADOS_SYNC, f"{nombre_indice}__{namespace}.json")
+
+def leer_estado(ruta: str) -> Tuple[Optional[Dict[str, Dict[str, Any]]], Optional[str]]:
+    """
+    Devuelve ({id: {texto, metadata, campos}}, versión del namespace al guardarlo),
+    o (None, None) si el namespace nunca se sincronizó desde acá.
+    """
+    if not os.path.exists(ruta):
+        return None, None
+    with open(ruta, "r", encoding="utf-8") as f:
+        estado = json.load(f)
+    return estado["hashes"], estado.get("version")
+
+def guardar_estado(ruta: str, namespace: str, hashes: Dict[str, Dict[str, Any]], version: Optional[str]):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    with open(ruta + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"namespace": namespace, "version": version, "hashes": hashes}, f, ensure_ascii=False)
+    os.replace(ruta + ".tmp", ruta)
+
+def version_actual(index, namespace: str) -> Optional[str]:
+    """
+    Versión de contenido del namespace: la calculada por el índice local o la
+    publicada en Pinecone por la última escritura (de cualquier máquina o script).
+    """
+    if hasattr(index, "version"):
+        return index.version(namespace)
+    return leer_version(index, namespace)
+
+def ids_en_indice(index, namespace: str) -> List[str]:
+    if hasattr(index, "ids"):
+        return index.ids(namespace)
+    return [id_vector for pagina in listar_ids(index, namespace) for id_vector in pagina]
+
+def vectores_en_indice(index, namespace: str) -> int:
+    namespaces = index.describe_index_stats().get("namespaces", {})
+    return namespaces[namespace]["vector_count"] if namespace in namespaces else 0
+
+
+class PlanSync:
+    """Qué hay que hacer con cada pictograma para llevar el namespace al estado del JSON."""
+
+    def __init__(self):
+        self.embeber: List[int] = []  # posiciones con texto nuevo o cambiado
+        self.metadata: List[int] = []  # posiciones con el mismo texto y metadata distinta
+        self.borrar: List[str] = []  # ids que ya no están en el JSON
+        self.sin_cambios = 0
+        self.hashes: Dict[str, Dict[str, Any]] = {}
+
+def planificar(ids: List[str], textos: List[str], metadatas: List[Dict[str, Any]],
+               previos: Dict[str, Optional[Dict[str, Any]]]) -> PlanSync:
+    plan = PlanSync()
+    ultima = {id_vector: i for i, id_vector in enumerate(ids)}  # ids repetidos: gana el último
+    for id_vector, i in ultima.items():
+        actual = {
+            "texto": hash_contenido(textos[i]),
+            "metadata": hash_contenido(metadatas[i]),
+            "campos": sorted(metadatas[i]),
+        }
+        plan.hashes[id_vector] = actual
+        previo = previos.get(id_vector)
+        if previo is None or previo["texto"] != actual["texto"] or set(previo["campos"]) - set(actual["campos"]):
+            # Un update solo agrega o pisa campos; si se quitó alguno hay que reemplazar el vector entero
+            plan.embeber.append(i)
+        elif previo["metadata"] != actual["metadata"]:
+            plan.metadata.append(i)
+        else:
+            plan.sin_cambios += 1
+    plan.borrar = [id_vector for id_vector in previos if id_vector not in ultima]
+    return plan
+
+def sincronizar(items: List[Any], ids: List[str], textos: List[str], metadatas: List[Dict[str, Any]],
+                construir_vector: Callable[[Any, List[float]], Dict[str, Any]],
+                index, namespace: str, ruta: str,
+                confirmar_borrado: Optional[Callable[[List[str]], bool]] = None) -> Dict[str, int]:
+    """
+    Sincroniza el namespace con `items` usando los hashes guardados en `ruta`:
+    solo se embeben y suben los ítems cuyo texto cambió, los que cambiaron solo
+    en campos de metadata que no forman parte del texto se actualizan sin
+    embeber, y los ids que desaparecieron se borran.
+    Los hashes solo se usan si la versión del namespace sigue siendo la que
+    dejó esta sincronización; si otra escritura (inserción completa, otra
+    máquina, otro script) la cambió, o no hay hashes, se parte de los ids del
+    índice: todo se vuelve a subir (con los embeddings del cache) y se borra
+    lo que sobra.
+    Si hay más de MAX_BORRADOS_SIN_CONFIRMAR ids para borrar, solo se borran si
+    `confirmar_borrado(ids)` devuelve True; sin esa función se conservan.
+    """
+    previos, version_guardada = leer_estado(ruta)
+    version = version_actual(index, namespace)
+    if (previos is None or version_guardada is None or version_guardada != version
+            or len(previos) != vectores_en_indice(index, namespace)):
+        print("⚠️ Sin hashes vigentes para el namespace: se comparan los ids del índice")
+        previos = {id_vector: None for id_vector in ids_en_indice(index, namespace)}
+
+    plan = planificar(ids, textos, metadatas, previos)
+    print(f"🔁 Sync '{namespace}': {len(plan.embeber)} a embeber, {len(plan.metadata)} solo metadata, "
+          f"{len(plan.borrar)} a borrar, {plan.sin_cambios} sin cambios")
+
+    if plan.embeber:
+        insertar_con_embeddings([items[i] for i in plan.embeber], [textos[i] for i in plan.embeber],
+                                construir_vector, index, namespace)
+
+    if plan.metadata:
+        with ThreadPoolExecutor(max_workers=HILOS_UPDATE) as pool:
+            list(pool.map(lambda i: index.update(id=ids[i], set_metadata=metadatas[i], namespace=namespace),
+                          plan.metadata))
+        print(f"✏️ Metadata actualizada en {len(plan.metadata)} vectores")
+
+    if len(plan.borrar) > MAX_BORRADOS_SIN_CONFIRMAR and not (confirmar_borrado and confirmar_borrado(plan.borrar)):
+        print(f"⏭️ Se conservan los {len(plan.borrar)} vectores que no están en el JSON (borrado no confirmado)")
+        # El estado los sigue registrando para que coincida con lo que hay en el índice. Sin
+        # hash previo (se partió de los ids del índice) el contenido es desconocido: si vuelven
+        # a aparecer en el JSON se re-embeben
+        for id_vector in plan.borrar:
+            plan.hashes[id_vector] = previos[id_vector] or {"texto": None, "metadata": None, "campos": []}
+        plan.borrar = []
+
+    for i in range(0, len(plan.borrar), TAMANIO_DELETE):
+        index.delete(ids=plan.borrar[i:i+TAMANIO_DELETE], namespace=namespace)
+    if plan.borrar:
+        print(f"🗑️ {len(plan.borrar)} vectores borrados")
+
+    if plan.embeber or plan.metadata or plan.borrar:
+        # Versión derivada del contenido: dos sincronizaciones al mismo JSON publican la misma
+        # (se guarda la publicada, sin releerla: el fetch de Pinecone puede tardar en verla)
+        version = publicar_version(index, namespace, hash_contenido(plan.hashes)) or version_actual(index, namespace)
+    guardar_estado(ruta, namespace, plan.hashes, version)
+    return {"embebidos": len(plan.embeber), "metadata": len(plan.metadata),
+            "borrados": len(plan.borrar), "sin_cambios": plan.sin_cambios}